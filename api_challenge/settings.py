@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.0/ref/settings/
 
 import os
 from pathlib import Path
+import dj_database_url
 from dotenv import load_dotenv, find_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -50,8 +51,16 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'bookstore.db.ReplicaStickinessMiddleware',
 ]
 
+# Opt-in per-request query and timing instrumentation
+if os.environ.get('REQUEST_METRICS', '0') == '1':
+    MIDDLEWARE.insert(0, 'bookstore.middleware.RequestMetricsMiddleware')
+
+# Addresses allowed to read internal statistics
+INTERNAL_IPS = os.environ.get('INTERNAL_IPS', '127.0.0.1').split(',')
+
 ROOT_URLCONF = 'api_challenge.urls'
 
 TEMPLATES = [
@@ -76,11 +85,46 @@ WSGI_APPLICATION = 'api_challenge.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
+# Seconds for which connections are kept open between requests
+conn_max_age = int(os.environ.get('CONN_MAX_AGE', 60))
+
 DATABASES = {
+    'default': dj_database_url.config(
+        default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}",
+        conn_max_age=conn_max_age),
+}
+
+# Optional read replica for GET books/ and books/<id>/, e.g.
+# REPLICA_DATABASE_URL=sqlite:////tmp/replica.sqlite3
+if os.environ.get('REPLICA_DATABASE_URL'):
+    DATABASES['replica'] = dj_database_url.parse(
+        os.environ['REPLICA_DATABASE_URL'], conn_max_age=conn_max_age)
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['bookstore.db.PrimaryReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'bookstore'),
+    },
+    # Google Books API responses, kept for revalidation after they expire
+    'google_books': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('GOOGLE_BOOKS_CACHE_LOCATION',
+                                   BASE_DIR / '.cache' / 'google_books'),
+        'TIMEOUT': int(os.environ.get('GOOGLE_BOOKS_CACHE_MAX_AGE',
+                                      7 * 24 * 60 * 60)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('GOOGLE_BOOKS_CACHE_ENTRIES',
+                                              1000)),
+        },
+    },
 }
 
 
@@ -139,3 +183,23 @@ app_version = {
     }
 
 google_books = "https://www.googleapis.com/"
+google_books_max_concurrency = int(
+    os.environ.get("GOOGLE_BOOKS_MAX_CONCURRENCY", 4))
+# Seconds for which cached Google Books responses are used without
+# revalidation
+google_books_cache_ttl = int(os.environ.get("GOOGLE_BOOKS_CACHE_TTL", 3600))
+# Seconds to wait for connecting to Google Books API and between bytes of
+# a response, after which the request and its import job fail
+google_books_timeout = float(os.environ.get("GOOGLE_BOOKS_TIMEOUT", 10))
+
+import_workers = int(os.environ.get("IMPORT_WORKERS", 2))
+# Seconds after which a running import job without progress is taken for
+# orphaned by a dead worker and can be resumed
+import_job_timeout = int(os.environ.get("IMPORT_JOB_TIMEOUT", 600))
+# Serve books and imports with asynchronous views, for ASGI deployments
+async_views = os.environ.get("ASYNC_VIEWS", "0") == "1"
+books_cache_timeout = int(os.environ.get("BOOKS_CACHE_TIMEOUT", 300))
+slow_request_ms = int(os.environ.get("SLOW_REQUEST_MS", 500))
+# Seconds for which a client reads from the primary database after a write,
+# so that it sees its own changes despite replication lag
+replica_sticky_seconds = int(os.environ.get("REPLICA_STICKY_SECONDS", 5))
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Author, Book
+from .models import Author, Book, ImportJob
 
 admin.site.register(Author)
 admin.site.register(Book)
+admin.site.register(ImportJob)
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.core.signals import request_started
+from django.db.models.signals import post_migrate
 
 
 class BookstoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bookstore'
+
+    def ready(self):
+        # pylint: disable=import-outside-toplevel
+        from .db import close_unusable_connections
+        from .search import install_search_index
+        from . import signals  # noqa: F401
+        post_migrate.connect(install_search_index, sender=self)
+        request_started.connect(close_unusable_connections)
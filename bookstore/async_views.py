@@ -0,0 +1,140 @@
+"""
+This module provides asynchronous versions of Books, BookDetails and
+ImportBooks views for ASGI deployments. Reads and imports wait on the
+event loop, so a single worker serves many requests concurrently; writes
+are delegated to the synchronous views.
+"""
+
+import asyncio
+import json
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAcceptable
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from .import_jobs import aenqueue_import
+from .renderers import BookJSONRenderer
+from .serializers import ImportJobSerializer
+from . import views
+
+
+class AsyncView(View):
+    """
+    A class for views with coroutine handlers, exempt from CSRF checks like
+    DRF views. Requests which aren't served asynchronously are delegated to
+    the synchronous sync_view.
+    """
+    sync_view = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+
+        async def async_view(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+            return response
+
+        async_view.view_class = cls
+        async_view.view_initkwargs = initkwargs
+        async_view.csrf_exempt = True
+        return async_view
+
+    async def delegate(self, request, *args, **kwargs):
+        """A method handling a request with the synchronous view."""
+        return await sync_to_async(self.sync_view.as_view())(
+            request, *args, **kwargs)
+
+    def renders_json(self, request, kwargs):
+        """
+        A method checking whether the synchronous view would render
+        a request as JSON, the only format rendered asynchronously, using
+        DRF's content negotiation with the view's renderers.
+        """
+        negotiator = api_settings.DEFAULT_CONTENT_NEGOTIATION_CLASS()
+        renderers = [renderer() for renderer in
+                     self.sync_view.renderer_classes]
+        try:
+            renderer, _ = negotiator.select_renderer(
+                Request(request), renderers, kwargs.get('format'))
+        except NotAcceptable:
+            return False
+        return renderer.format == 'json'
+
+
+async def render_books(get_data, request, *args):
+    """
+    A function running a view's data function in a thread and rendering
+    its result as a JSON response with an ETag, a 304 response or an error.
+    """
+    try:
+        etag, data = await sync_to_async(get_data)(Request(request), *args)
+    except APIException as error:
+        return JsonResponse({"detail": error.detail},
+                            status=error.status_code)
+    if data is None:
+        return HttpResponseNotModified(
+            headers={'ETag': etag, 'Vary': 'Accept'})
+    return HttpResponse(BookJSONRenderer().render(data),
+                        content_type='application/json',
+                        headers={'ETag': etag, 'Vary': 'Accept'})
+
+
+class AsyncBooks(AsyncView):
+    """
+    A class for asynchronous GET, POST, PATCH and DELETE /books view.
+    Writes and formats other than JSON are handled by Books.
+    """
+    sync_view = views.Books
+
+    async def get(self, request, *args, **kwargs):
+        """A method for GET requests, served like Books.get."""
+        if not self.renders_json(request, kwargs):
+            return await self.delegate(request, *args, **kwargs)
+        return await render_books(views.get_books_data, request)
+
+    post = AsyncView.delegate
+    patch = AsyncView.delegate
+    delete = AsyncView.delegate
+
+
+class AsyncBookDetails(AsyncView):
+    """
+    A class for asynchronous GET, PATCH and DELETE /books/<id> view.
+    Writes and formats other than JSON are handled by BookDetails.
+    """
+    sync_view = views.BookDetails
+
+    async def get(self, request, *args, **kwargs):
+        """A method for GET /books/<id>, served like BookDetails.retrieve."""
+        if not self.renders_json(request, kwargs):
+            return await self.delegate(request, *args, **kwargs)
+        return await render_books(views.get_book_data, request, kwargs['id'])
+
+    patch = AsyncView.delegate
+    delete = AsyncView.delegate
+
+
+class AsyncImportBooks(AsyncView):
+    """
+    A class for asynchronous POST /import view.
+    """
+    async def post(self, request, *args, **kwargs):
+        """
+        A method for POST requests. The import runs as a task on the event
+        loop of the server, its progress is available at
+        GET /import/<job_id>.
+        """
+        data = json.loads(request.body)
+        try:
+            authors = views.import_authors(data)
+        except APIException as error:
+            return JsonResponse({"detail": error.detail},
+                                status=error.status_code)
+        job = await aenqueue_import(authors,
+                                    refresh=bool(data.get('refresh')))
+        return JsonResponse(ImportJobSerializer(job).data,
+                            status=status.HTTP_202_ACCEPTED)
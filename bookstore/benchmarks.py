@@ -0,0 +1,179 @@
+"""
+This module provides a microbenchmark suite for book queries, serialization
+and Google Books import, run against a synthetic catalogue.
+"""
+
+import random
+import time
+import tracemalloc
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from .models import Author, Book
+from .serializers import BookSerializer
+from .google_api_handler import parse_google_books_into_db
+from .stats import add_books, catalogue_stats, filtered_stats
+from .renderers import BookJSONRenderer, MessagePackRenderer
+from . import book_queries
+
+CHUNK_SIZE = 5000
+WORDS = ["stories", "tales", "poems", "chronicles", "essays", "letters",
+         "journeys", "legends", "memories", "secrets"]
+
+
+def random_year(rng, years, distribution):
+    """Return a publication year drawn from the given distribution."""
+    first, last = years
+    if distribution == 'recent':
+        return int(rng.triangular(first, last, last))
+    return rng.randint(first, last)
+
+
+def generate_catalogue(books=1000, authors=200, authors_per_book=2,
+                       years=(1900, 2022), distribution='uniform', seed=0):
+    """
+    Fill the database with a synthetic catalogue of books, each written by
+    1 to authors_per_book authors drawn from a pool of authors.
+    """
+    rng = random.Random(seed)
+    author_objs = Author.objects.bulk_create(
+        [Author(name=f"Author {number}") for number in range(authors)],
+        batch_size=CHUNK_SIZE)
+    if any(author.pk is None for author in author_objs):
+        author_objs = list(Author.objects.filter(name__startswith='Author '))
+    author_ids = [author.pk for author in author_objs]
+
+    book_authors = Book.authors.through
+    for start in range(0, books, CHUNK_SIZE):
+        chunk = [Book(external_id=f"bench-{number}",
+                      title=f"Book {number} {rng.choice(WORDS)}",
+                      acquired=rng.random() < 0.3,
+                      published_year=random_year(rng, years, distribution))
+                 for number in range(start, min(start + CHUNK_SIZE, books))]
+        chunk = Book.objects.bulk_create(chunk)
+        if any(book.pk is None for book in chunk):
+            chunk = list(Book.objects.filter(external_id__in=[
+                book.external_id for book in chunk]))
+        book_authors.objects.bulk_create([
+            book_authors(book_id=book.pk, author_id=author_id)
+            for book in chunk
+            for author_id in rng.sample(
+                author_ids, rng.randint(1, min(authors_per_book,
+                                               len(author_ids))))
+        ], batch_size=CHUNK_SIZE)
+        book_queries.refresh_fragments(book.pk for book in chunk)
+        add_books([book.pk for book in chunk])
+
+
+def generate_google_volumes(volumes=1000, authors=50, authors_per_book=2,
+                            years=(1900, 2022), seed=0):
+    """
+    Return a list of synthetic volumes shaped like Google Books API search
+    results.
+    """
+    rng = random.Random(seed)
+    names = [f"Google Author {number}" for number in range(authors)]
+    return [{
+        "kind": "books#volume",
+        "id": f"google-{number}",
+        "volumeInfo": {
+            "title": f"Volume {number} {rng.choice(WORDS)}",
+            "authors": rng.sample(names, rng.randint(
+                1, min(authors_per_book, len(names)))),
+            "publishedDate": f"{rng.randint(*years)}-01-01",
+            "imageLinks": {
+                "thumbnail": f"http://books.example.com/{number}.jpg"},
+        },
+    } for number in range(volumes)]
+
+
+def measure(function, repeat=1, memory_run=True):
+    """
+    Run function repeat times and return the best wall time, the number
+    of queries and the peak of allocated memory of a single run. Memory is
+    traced in an additional run, because tracing slows the code down,
+    unless memory_run is False and it is traced in the timed runs.
+    """
+    wall_times = []
+    for _ in range(repeat):
+        if not memory_run:
+            tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            function()
+            wall_times.append(time.perf_counter() - start)
+    if memory_run:
+        tracemalloc.start()
+        function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "wall_time": min(wall_times),
+        "queries": len(queries),
+        "peak_memory": peak,
+    }
+
+
+def run_benchmarks(books=1000, authors=200, authors_per_book=2,
+                   years=(1900, 2022), distribution='uniform',
+                   import_volumes=1000, repeat=3, seed=0):
+    """
+    Generate a catalogue in the current database and return results of all
+    benchmarks keyed by benchmark name.
+    """
+    generate_catalogue(books, authors, authors_per_book, years,
+                       distribution, seed)
+    middle = (years[0] + years[1]) // 2
+    year_range = {'from': str(middle - 10), 'to': str(middle + 10)}
+    some_authors = ','.join(Author.objects.values_list('name', flat=True)
+                            .order_by('id')[:2])
+    listed = list(book_queries.prefetch_authors(Book.objects.all()))
+    serialized = BookSerializer(listed, many=True).data
+    volumes = generate_google_volumes(import_volumes, seed=seed)
+
+    benchmarks = {
+        "filter_books_years": lambda: list(
+            book_queries.filter_books(**year_range)),
+        "get_books_title": lambda: list(book_queries.get_books(
+            {'title': WORDS[0]}, method=None)),
+        "get_books_authors": lambda: list(book_queries.get_books(
+            {'authors': some_authors, 'authors_match': 'any'},
+            method=None)),
+        "get_books_prefetch_authors": lambda: list(
+            book_queries.prefetch_authors(Book.objects.all())),
+        "serialize_books": lambda: BookSerializer(listed, many=True).data,
+        "stitch_fragments": lambda: '[' + ','.join(book_queries.get_fragments(
+            Book.objects.values('id', 'fragment'))) + ']',
+        "render_json": lambda: BookJSONRenderer().render(serialized),
+        "render_msgpack": lambda: MessagePackRenderer().render(serialized),
+        "catalogue_stats": catalogue_stats,
+        "filtered_stats_years": lambda: filtered_stats(
+            book_queries.filter_books(**year_range)),
+    }
+    results = {name: measure(function, repeat)
+               for name, function in benchmarks.items()}
+    # the first import creates all books, following ones update them
+    results["import_google_volumes"] = measure(
+        lambda: parse_google_books_into_db(volumes), memory_run=False)
+    results["reimport_google_volumes"] = measure(
+        lambda: parse_google_books_into_db(volumes), repeat)
+    return results
+
+
+def compare_results(results, baseline, threshold=0.1):
+    """
+    Compare results with a baseline and return a list of rows
+    (benchmark, metric, baseline, current, change, regressed) where change
+    is the relative difference and regressed is True if it exceeds the
+    threshold.
+    """
+    rows = []
+    for name, metrics in results.items():
+        for metric, current in metrics.items():
+            previous = baseline.get(name, {}).get(metric)
+            if previous is None:
+                continue
+            change = (current - previous) / previous if previous else \
+                float(current > previous)
+            rows.append((name, metric, previous, current, change,
+                         change > threshold))
+    return rows
@@ -5,8 +5,18 @@ and acquiring Book objects.
 
 
 from django.http import Http404
-from django.db.models import Count
-from .models import Book
+from rest_framework.renderers import JSONRenderer
+from django.db import connection
+from django.db.models import Count, Prefetch, Q
+from django.db.models.expressions import RawSQL
+from .models import Author, Book
+from .search import search_titles
+from .serializers import BookSerializer
+from .stats import add_books
+
+# GET /books parameters supported by filter_books, usable in batch filters
+INTEGER_FILTERS = ('id', 'from', 'to', 'published_year')
+TEXT_FILTERS = ('external_id', 'title', 'author')
 
 
 def filter_books(**kwargs):
@@ -24,16 +34,20 @@ def filter_books(**kwargs):
         book_filter['published_year__lte'] = int(kwargs['to'])
     if 'published_year' in kwargs:
         book_filter['published_year__exact'] = int(kwargs['published_year'])
-    # filtering by a list of authors is ommited, because queries with authors
-    # are executed by get_books_by_authors
+    # filtering by a list of authors ('a,b,c' or a list) is executed
+    # by get_books_by_authors
+    authors = None
     if 'author' in kwargs:
         book_filter['authors__name__icontains'] = kwargs['author'].strip('"')
     if 'authors' in kwargs:
-        if isinstance(kwargs['authors'], str):
-            kwargs['authors'].strip('"')
-            book_filter['authors__name__icontains'] = kwargs['authors']
-    if 'title__icontains' in kwargs:
-        book_filter['title__icontains'] = kwargs['title__icontains'].strip('"')
+        if isinstance(kwargs['authors'], str) and ',' not in kwargs['authors']:
+            book_filter['authors__name__icontains'] = \
+                kwargs['authors'].strip('"')
+        elif isinstance(kwargs['authors'], str):
+            authors = [author.strip().strip('"') for author in
+                       kwargs['authors'].split(',') if author.strip()]
+        else:
+            authors = kwargs['authors']
     if 'title__exact' in kwargs:
         book_filter['title__exact'] = kwargs['title__exact'].strip('"')
     if 'acquired' in kwargs:
@@ -41,7 +55,14 @@ def filter_books(**kwargs):
             kwargs['acquired'].lower()
         book_filter['acquired'] = kwargs['acquired'] == 'true'
 
-    return Book.objects.filter(**book_filter)
+    books = Book.objects.filter(**book_filter)
+    if authors:
+        books = get_books_by_authors(
+            authors, books, match=kwargs.get('authors_match', 'all'))
+    # Search titles with the full-text index, ordered by relevance
+    if 'title__icontains' in kwargs:
+        books = search_titles(books, kwargs['title__icontains'].strip('"'))
+    return books
 
 
 def get_books(data, method):
@@ -76,24 +97,234 @@ def get_books(data, method):
     return books
 
 
-def get_book_details(requested_id):
+def prefetch_authors(queryset):
+    """
+    Fetch authors of all books in queryset with one batched query, loading
+    only the columns needed by the serializer. Authors of every book keep
+    the order they were added in, like in export.add_authors.
+    """
+    through = connection.ops.quote_name(Book.authors.through._meta.db_table)
+    authors = Author.objects.only('id', 'name') \
+        .order_by(RawSQL(f'{through}.id', ()))
+    return queryset.prefetch_related(Prefetch('authors', queryset=authors))
+
+
+def select_fields(queryset, fields):
+    """
+    Load only the columns of requested fields of books, and their authors
+    only if 'authors' is requested.
+    """
+    queryset = queryset.only(
+        'id', *[field for field in fields if field != 'authors'])
+    if 'authors' in fields:
+        queryset = prefetch_authors(queryset)
+    return queryset
+
+
+def get_book_details(requested_id, with_authors=False):
     """
     Return Book object for requested id or Http404.
     """
-    book = filter_books(id=requested_id['id']).first()
+    books = filter_books(id=requested_id['id'])
+    if with_authors:
+        books = prefetch_authors(books)
+    book = books.first()
     if book:
         return book
     else:
         return None
 
 
-def get_books_by_authors(authors, queryset=Book.objects):
+def get_books_by_authors(authors, queryset=Book.objects, match='all'):
+    """
+    Filter queryset for a book with multiple prompted authors using a single
+    grouped subquery. With match='all' books must have all of the authors,
+    with 'any' at least one of them and with 'exact' exactly these authors.
+    """
+    names = {str(author) for author in authors}
+    if not names:
+        return queryset
+    links = Book.authors.through.objects.values('book_id')
+    if match == 'exact':
+        links = links.annotate(
+            matched=Count('id', filter=Q(author__name__in=names)),
+            total=Count('id')).filter(matched=len(names), total=len(names))
+    else:
+        required = len(names) if match == 'all' else 1
+        links = links.filter(author__name__in=names) \
+            .annotate(matched=Count('id')).filter(matched__gte=required)
+
+    return queryset.filter(id__in=links.values('book_id'))
+
+
+def get_or_create_authors(names):
     """
-    Filter queryset for a book with multiple prompted authors.
+    Return a dictionary mapping every given name to its Author object,
+    creating all missing authors in the order of the names with a single
+    bulk insert.
     """
-    queryset.annotate(count=Count('authors'))
+    names = dict.fromkeys(names)
+    authors = {author.name: author for author in
+               Author.objects.filter(name__in=list(names))}
+    missing = [name for name in names if name not in authors]
+    if missing:
+        Author.objects.bulk_create([Author(name=name) for name in missing],
+                                   ignore_conflicts=True)
+        authors.update({author.name: author for author in
+                        Author.objects.filter(name__in=missing)})
+    return authors
 
-    for author in authors:
-        queryset = queryset.filter(authors__name=author)
 
-    return queryset
+def find_duplicate_books(items):
+    """
+    Return the book already in the database for every item of a batch
+    (or None), matching title, published year, external id and authors
+    like get_books(method='exact'), with one query for the whole batch.
+    """
+    titles = {item.get('title') for item in items if item.get('title')}
+    by_title = {}
+    for book in prefetch_authors(Book.objects.filter(title__in=titles)):
+        by_title.setdefault(book.title, []).append(book)
+
+    def matches(book, item):
+        if 'published_year' in item and \
+                str(book.published_year) != str(item['published_year']):
+            return False
+        if 'external_id' in item and book.external_id != item['external_id']:
+            return False
+        authors = item.get('authors') or []
+        if isinstance(authors, str):
+            authors = [authors]
+        names = {author.name for author in book.authors.all()}
+        return set(authors) <= names
+
+    return [next((book for book in by_title.get(item.get('title'), [])
+                  if matches(book, item)), None) for item in items]
+
+
+def create_books(books):
+    """
+    Insert (Book, author names) pairs in bulk, creating missing authors,
+    and store their JSON fragments and counts. Books get their primary keys
+    set.
+    """
+    books = list(books)
+    if connection.features.can_return_rows_from_bulk_insert:
+        Book.objects.bulk_create([book for book, _ in books])
+    else:
+        for book, _ in books:
+            book.save()
+    authors = get_or_create_authors(
+        name for _, names in books for name in names)
+    book_authors = Book.authors.through
+    book_authors.objects.bulk_create([
+        book_authors(book_id=book.id, author_id=authors[name].id)
+        for book, names in books for name in dict.fromkeys(names)])
+    refresh_fragments(book.id for book, _ in books)
+    add_books([book.id for book, _ in books])
+
+
+def parse_ids(ids):
+    """
+    Return a list of ids given as integers or strings of digits, or None if
+    any of them isn't one.
+    """
+    parsed = []
+    for book_id in ids:
+        if isinstance(book_id, bool) or not isinstance(book_id, (int, str)):
+            return None
+        try:
+            parsed.append(int(book_id))
+        except ValueError:
+            return None
+    return parsed
+
+
+def parse_filter(data):
+    """
+    Return a batch 'filter' as GET /books parameters for get_books, or None
+    if it's empty, has a parameter filter_books doesn't support or a value
+    which is empty or of a wrong type.
+    """
+    if not isinstance(data, dict) or not data:
+        return None
+    parsed = {}
+    for param, value in data.items():
+        if param in INTEGER_FILTERS and not isinstance(value, bool) and \
+                isinstance(value, (int, str)):
+            try:
+                parsed[param] = int(value)
+            except ValueError:
+                return None
+        elif param == 'acquired' and isinstance(value, bool):
+            parsed[param] = 'true' if value else 'false'
+        elif param == 'acquired' and isinstance(value, str) and \
+                value.lower() in ('true', 'false'):
+            parsed[param] = value.lower()
+        elif param == 'authors_match' and value in ('all', 'any', 'exact'):
+            parsed[param] = value
+        elif param == 'authors' and isinstance(value, list) and value and \
+                all(isinstance(name, str) and name.strip()
+                    for name in value):
+            parsed[param] = value
+        elif param == 'authors' and isinstance(value, str) and \
+                any(name.strip().strip('"') for name in value.split(',')):
+            parsed[param] = value
+        elif param in TEXT_FILTERS and isinstance(value, str) and \
+                value.strip().strip('"'):
+            parsed[param] = value
+        else:
+            return None
+    return parsed
+
+
+def get_batch_books(data):
+    """
+    Return a queryset of books selected by a batch request, either by
+    a list of integer 'ids' or by a 'filter' of GET /books parameters, or
+    None if neither is given or either is invalid.
+    """
+    if not isinstance(data, dict):
+        return None
+    if isinstance(data.get('ids'), list) and data['ids']:
+        ids = parse_ids(data['ids'])
+        return None if ids is None else Book.objects.filter(id__in=ids)
+    book_filter = parse_filter(data.get('filter'))
+    if book_filter is None:
+        return None
+    return get_books(book_filter, method=None)
+
+
+def render_fragment(book):
+    """
+    Return the JSON representation of a book as rendered by GET /books.
+    """
+    return JSONRenderer().render(BookSerializer(book).data).decode()
+
+
+def refresh_fragments(ids):
+    """
+    Recompute stored JSON fragments of books with given ids.
+    """
+    books = list(prefetch_authors(
+        Book.objects.filter(id__in=list(ids)).defer('fragment')))
+    renderer = JSONRenderer()
+    for book, data in zip(books, BookSerializer(books, many=True).data):
+        book.fragment = renderer.render(data).decode()
+    Book.objects.bulk_update(books, ['fragment'], batch_size=1000)
+
+
+def get_fragments(books):
+    """
+    Return stored JSON fragments for rows with 'id' and 'fragment' of
+    a books queryset, rendering fragments which are missing.
+    """
+    rows = list(books)
+    missing = [row['id'] for row in rows if row['fragment'] is None]
+    if missing:
+        rendered = {book.id: render_fragment(book) for book in
+                    prefetch_authors(Book.objects.filter(id__in=missing))}
+        for row in rows:
+            if row['fragment'] is None:
+                row['fragment'] = rendered[row['id']]
+    return [row['fragment'] for row in rows]
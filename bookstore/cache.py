@@ -0,0 +1,98 @@
+"""
+This module provides a shared response cache and ETags for books,
+invalidated by a catalogue generation counter bumped on every write.
+"""
+
+import hashlib
+from django.core.cache import caches
+from django.db.models import F
+from django.utils.http import quote_etag
+from api_challenge.settings import books_cache_timeout
+from .models import Catalogue
+
+HITS_KEY = 'bookstore:hits'
+MISSES_KEY = 'bookstore:misses'
+
+
+def get_cache():
+    """Return the cache used for book lists."""
+    return caches['default']
+
+
+def increment(key):
+    """Increment a counter stored in the cache, creating it if needed."""
+    cache = get_cache()
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # the counter was evicted between add() and incr()
+        cache.add(key, 1, timeout=None)
+        return 1
+
+
+def catalogue_generation():
+    """
+    Return the current catalogue generation. It is kept in the database,
+    so that all server processes agree on it.
+    """
+    generation = Catalogue.objects.values_list('generation', flat=True) \
+        .first()
+    return generation or 0
+
+
+def bump_catalogue_generation():
+    """Invalidate all cached book lists and ETags after the catalogue
+    changed."""
+    if not Catalogue.objects.update(generation=F('generation') + 1):
+        Catalogue.objects.get_or_create(id=1, defaults={'generation': 1})
+
+
+def books_cache_key(request, generation=None):
+    """
+    Return a cache key for the request's normalized query parameters
+    and the catalogue generation.
+    """
+    if generation is None:
+        generation = catalogue_generation()
+    params = sorted((key, sorted(values)) for key, values in
+                    request.query_params.lists())
+    raw = repr((request.get_host(), request.path, params))
+    digest = hashlib.sha256(raw.encode()).hexdigest()
+    return f"bookstore:books:{generation}:{digest}"
+
+
+def catalogue_etag(generation, *parts):
+    """
+    Return a strong ETag for a response depending only on the catalogue
+    generation and the given parts, e.g. a cache key or a book id.
+    """
+    raw = repr((generation,) + parts)
+    return quote_etag(hashlib.sha256(raw.encode()).hexdigest()[:32])
+
+
+def get_cached_books(key):
+    """Return cached response data for key or None, counting hits and
+    misses."""
+    data = get_cache().get(key)
+    increment(MISSES_KEY if data is None else HITS_KEY)
+    return data
+
+
+def set_cached_books(key, data):
+    """Store response data for key."""
+    get_cache().set(key, data, timeout=books_cache_timeout)
+
+
+def cache_stats():
+    """Return the number of cache hits and misses and the hit ratio."""
+    cache = get_cache()
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / total if total else None,
+        "generation": catalogue_generation(),
+    }
@@ -0,0 +1,86 @@
+"""
+This module provides routing of book reads to an optional read replica
+with read-your-writes stickiness, and health checks of persistent
+database connections.
+"""
+
+import contextvars
+from contextlib import contextmanager
+from django.db import DEFAULT_DB_ALIAS, connections
+from api_challenge.settings import replica_sticky_seconds
+
+REPLICA = 'replica'
+# set on responses to writes, so the client reads from the primary until
+# the replica caught up
+STICKY_COOKIE = 'bookstore_primary'
+
+replica_reads = contextvars.ContextVar('replica_reads', default=False)
+
+
+def replica_available():
+    """Return True if a read replica is configured."""
+    return REPLICA in connections.settings
+
+
+@contextmanager
+def read_from_replica(request):
+    """
+    Route reads made in the block to the replica, unless none is configured
+    or the request's client wrote recently.
+    """
+    token = replica_reads.set(replica_available() and
+                              STICKY_COOKIE not in request.COOKIES)
+    try:
+        yield
+    finally:
+        replica_reads.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    A class for database router sending writes to the primary database and
+    reads inside read_from_replica() blocks to the replica.
+    """
+    def db_for_read(self, model, **hints):
+        """Return the replica for reads routed to it."""
+        return REPLICA if replica_reads.get() else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        """Return the primary database for all writes."""
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Allow relations, both databases hold the same data."""
+        return True
+
+
+class ReplicaStickinessMiddleware:
+    """
+    A middleware class marking clients which successfully wrote with
+    a cookie, so that their following reads go to the primary database
+    for settings.replica_sticky_seconds.
+    """
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in self.safe_methods and \
+                response.status_code < 400 and replica_available():
+            response.set_cookie(STICKY_COOKIE, '1',
+                                max_age=replica_sticky_seconds,
+                                httponly=True, samesite='Lax')
+        return response
+
+
+def close_unusable_connections(**kwargs):
+    """
+    Close persistent connections which were dropped by the database server,
+    so that the request opens new ones instead of failing.
+    """
+    for connection in connections.all():
+        if connection.connection is not None and \
+                not connection.is_usable():
+            connection.close()
@@ -10,3 +10,53 @@ class InvalidId(APIException):
     status_code = 404
     default_detail = "There is no book with requested id."
     default_code = "invalid_id"
+
+
+class InvalidJobId(APIException):
+    """An class for handling exceptions caused by invalid
+    import job id."""
+    status_code = 404
+    default_detail = "There is no import job with requested id."
+    default_code = "invalid_job_id"
+
+
+class InvalidBatch(APIException):
+    """An class for handling exceptions caused by batch requests
+    without books to process, with invalid ids or an invalid filter."""
+    status_code = 400
+    default_detail = "Provide a list of integer 'ids' or a 'filter' of " \
+                     "GET /books parameters with non-empty values."
+    default_code = "invalid_batch"
+
+
+class InvalidImportFile(APIException):
+    """An class for handling exceptions caused by file imports
+    without a file."""
+    status_code = 400
+    default_detail = "Upload an NDJSON or CSV 'file' or send it as the body."
+    default_code = "invalid_import_file"
+
+
+class JobNotResumable(APIException):
+    """An class for handling exceptions caused by resuming import jobs
+    which didn't fail or stall."""
+    status_code = 409
+    default_detail = "Only failed or stalled import jobs can be resumed."
+    default_code = "job_not_resumable"
+
+
+class InvalidImportAuthors(APIException):
+    """An class for handling exceptions caused by import requests
+    without authors."""
+    status_code = 400
+    default_detail = "Provide an 'author' or a non-empty list of 'authors'."
+    default_code = "invalid_import_authors"
+
+
+class InvalidFields(APIException):
+    """An class for handling exceptions caused by requesting unknown
+    fields of books."""
+    status_code = 400
+    default_detail = "Request 'fields' out of: id, external_id, title, " \
+                     "authors, acquired, published_year, thumbnail."
+    default_code = "invalid_fields"
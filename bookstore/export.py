@@ -0,0 +1,76 @@
+"""
+This module provides streaming export of the catalogue as NDJSON or CSV,
+reading books in chunks with a server-side cursor, so that memory use
+doesn't depend on the size of the catalogue.
+"""
+
+import csv
+import io
+from .models import Book
+from .book_queries import get_fragments
+
+CHUNK_SIZE = 2000
+FIELDS = ['id', 'external_id', 'title', 'authors', 'acquired',
+          'published_year', 'thumbnail']
+# separates author names in the 'authors' CSV column
+AUTHORS_SEPARATOR = ';'
+
+
+def iterate_chunks(rows, chunk_size=CHUNK_SIZE):
+    """
+    This function reads a values() queryset with a server-side cursor and
+    yields its rows in lists of chunk_size.
+    """
+    chunk = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def add_authors(chunk):
+    """
+    This function adds the list of author names to every row of a chunk
+    with a single query for the whole chunk.
+    """
+    names = {}
+    for book_id, name in Book.authors.through.objects \
+            .filter(book_id__in=[row['id'] for row in chunk]) \
+            .order_by('id').values_list('book_id', 'author__name'):
+        names.setdefault(book_id, []).append(name)
+    for row in chunk:
+        row['authors'] = names.get(row['id'], [])
+    return chunk
+
+
+def export_ndjson(books, chunk_size=CHUNK_SIZE):
+    """
+    This function yields books of a queryset as newline delimited JSON,
+    one chunk of stored JSON fragments at a time.
+    """
+    for chunk in iterate_chunks(books.values('id', 'fragment'), chunk_size):
+        yield ''.join(fragment + '\n' for fragment in get_fragments(chunk))
+
+
+def export_csv(books, chunk_size=CHUNK_SIZE):
+    """
+    This function yields books of a queryset as CSV with a header row, one
+    chunk at a time. Author names are joined with AUTHORS_SEPARATOR.
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, FIELDS)
+    writer.writeheader()
+    rows = books.values(*[field for field in FIELDS if field != 'authors'])
+    for chunk in iterate_chunks(rows, chunk_size):
+        for row in add_authors(chunk):
+            row['authors'] = AUTHORS_SEPARATOR.join(row['authors'])
+            writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # the header of an empty export
+    if buffer.tell():
+        yield buffer.getvalue()
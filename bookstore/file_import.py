@@ -0,0 +1,161 @@
+"""
+This module provides importing books from NDJSON or CSV files shaped like
+sample_database.json. Files are parsed as a stream and written in batches,
+each in a single transaction, with the deduplication rules of Google Books
+imports.
+"""
+
+import codecs
+import csv
+import json
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from .models import Author, Book
+from .book_queries import create_books, find_duplicate_books
+from .cache import bump_catalogue_generation
+from .export import AUTHORS_SEPARATOR
+from .google_api_handler import save_volumes
+
+
+def read_ndjson(lines):
+    """
+    This function yields a record for every non-empty line of NDJSON,
+    or None for lines which aren't valid JSON.
+    """
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+
+def read_csv(lines):
+    """
+    This function yields a record for every row of UTF-8 encoded CSV lines
+    with a header row, splitting the 'authors' column on AUTHORS_SEPARATOR.
+    """
+    for row in csv.DictReader(codecs.iterdecode(lines, 'utf-8')):
+        authors = row.get('authors') or ''
+        row['authors'] = [name.strip() for name in
+                          authors.split(AUTHORS_SEPARATOR) if name.strip()]
+        yield row
+
+
+def clean_record(record):
+    """
+    This function returns Book fields and author names of a record, or None
+    if the record isn't a valid book. Book fields are validated like the
+    model's fields, so an invalid record never reaches a batch's insert.
+    """
+    if not isinstance(record, dict):
+        return None
+    title = record.get('title')
+    authors = record.get('authors') or []
+    if isinstance(authors, str):
+        authors = [authors]
+    authors = [str(name) for name in authors if name]
+    try:
+        published_year = int(record['published_year'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    max_name = Author._meta.get_field('name').max_length
+    if not title or any(len(name) > max_name for name in authors):
+        return None
+    acquired = record.get('acquired') or False
+    if isinstance(acquired, str):
+        acquired = acquired.strip().lower() == 'true'
+    book = Book(external_id=record.get('external_id') or None,
+                title=str(title), published_year=published_year,
+                thumbnail=record.get('thumbnail') or None,
+                acquired=bool(acquired))
+    try:
+        # optional fields are nullable, but not blank in forms
+        book.clean_fields(exclude=[
+            name for name in ('external_id', 'thumbnail')
+            if getattr(book, name) is None])
+    except ValidationError:
+        return None
+    return {
+        "external_id": book.external_id,
+        "title": book.title,
+        "authors": authors,
+        "published_year": book.published_year,
+        "thumbnail": book.thumbnail,
+        "acquired": book.acquired,
+    }
+
+
+def save_records(batch, counts):
+    """
+    This function writes a batch of cleaned records in a single transaction
+    and adds the numbers of inserted, updated and skipped books to counts.
+    Records with an external_id are upserted like Google Books volumes
+    (unchanged ones are skipped), the others are inserted unless the same
+    book is already there. The catalogue generation is only bumped if the
+    batch wrote books.
+    """
+    written = counts['inserted'] + counts['updated']
+    volumes, manual = {}, {}
+    for info in batch:
+        if info['external_id']:
+            if info['external_id'] in volumes:
+                counts['skipped'] += 1
+            volumes[info['external_id']] = info
+            continue
+        key = (info['title'], info['published_year'],
+               frozenset(info['authors']))
+        if key in manual:
+            counts['skipped'] += 1
+        manual.setdefault(key, info)
+    manual = list(manual.values())
+
+    with transaction.atomic():
+        if volumes:
+            saved = save_volumes(list(volumes.values()))
+            counts['inserted'] += saved['inserted']
+            counts['updated'] += saved['updated']
+            counts['skipped'] += saved['unchanged']
+        new_books = [
+            (Book(title=info['title'], published_year=info['published_year'],
+                  thumbnail=info['thumbnail'], acquired=info['acquired']),
+             info['authors'])
+            for info, book in zip(manual, find_duplicate_books(manual))
+            if book is None]
+        create_books(new_books)
+    counts['inserted'] += len(new_books)
+    counts['skipped'] += len(manual) - len(new_books)
+    if counts['inserted'] + counts['updated'] > written:
+        bump_catalogue_generation()
+
+
+def import_records(records, batch_size=500):
+    """
+    This function imports an iterable of records shaped like
+    sample_database.json in batches of batch_size and returns the numbers
+    of inserted, updated and skipped (invalid or duplicate) books.
+    """
+    counts = {"inserted": 0, "updated": 0, "skipped": 0}
+    batch = []
+    for record in records:
+        info = clean_record(record)
+        if info is None:
+            counts['skipped'] += 1
+            continue
+        batch.append(info)
+        if len(batch) == batch_size:
+            save_records(batch, counts)
+            batch = []
+    if batch:
+        save_records(batch, counts)
+    return counts
+
+
+def import_file(lines, file_format='ndjson', batch_size=500):
+    """
+    This function imports books from an iterable of lines (bytes) of an
+    NDJSON or CSV file.
+    """
+    reader = read_csv if file_format == 'csv' else read_ndjson
+    return import_records(reader(lines), batch_size)
@@ -3,103 +3,397 @@ This module provides functions for fetching books' information from
 Google Books API and parsing them info Bookstore database models.
 """
 
+import asyncio
+import hashlib
 import json
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import httpx
 import requests
-from api_challenge.settings import google_books
-from .models import Author, Book
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.db import transaction
+from api_challenge.settings import google_books, \
+    google_books_max_concurrency, google_books_cache_ttl, \
+    google_books_timeout
+from .models import Book
+from .cache import bump_catalogue_generation
 from . import book_queries
+from .stats import add_books, lock_books, remove_books
 
 
-def fetch_books(author, google_books_url=google_books):
+def volumes_url(google_books_url, author, fetch_size, start_index):
     """
-    This function imports data about books for requested author from Google
-    Books API.
+    This function returns the URL of a page of Google Books API search
+    results for requested author.
     """
-    fetch_size = 20
-    current_book = 0
-    total_books = 1
+    return f"{google_books_url}/books/v1/volumes?q=+inauthor:{author}&" \
+           f"maxResults={fetch_size}&startIndex={start_index}"
 
-    google_books_data = []
-    while current_book < total_books:
-        url = f"{google_books_url}/books/v1/volumes?q=+inauthor:{author}&" \
-              f"maxResults={fetch_size}&startIndex={current_book}"
-        response = requests.get(url).text
-        response_dict = json.dumps(response)
-        total_books = json.loads(response)['totalItems']
-        google_books_data += json.loads(response)['items']
-        current_book += fetch_size
 
-    return google_books_data
+def cached_page(url, refresh=False):
+    """
+    This function returns a pair of the page cached for url if it's still
+    fresh (or None) and the cache entry to revalidate (or None). With
+    refresh=True the cached page is ignored.
+    """
+    key = "google_books:" + hashlib.sha256(url.encode()).hexdigest()
+    entry = None if refresh else caches['google_books'].get(key)
+    if entry and time.time() - entry['fetched'] < google_books_cache_ttl:
+        return entry['page'], entry
+    return None, entry
 
 
-def parse_google_books_into_db(google_books_data):
+def revalidation_headers(entry):
     """
-    This function processes and formats given data, creates Book models
-    based on these data and returns the number of imported books as
-    a dictionary.
+    This function returns conditional request headers for a stale cache
+    entry.
     """
-    for entry in google_books_data:
-        volume = entry['volumeInfo']
-        image_links = volume.get('imageLinks') if \
-                      'imageLinks' in volume else None
-        thumbnail = image_links["thumbnail"] if image_links else None
-        info = {"external_id": entry.get("id"),
-                "title": volume.get("title"),
-                "authors": volume.get("authors"),
-                "thumbnail": thumbnail
-                }
-        pub_date = volume.get('publishedDate')
+    headers = {}
+    if entry and entry['etag']:
+        headers['If-None-Match'] = entry['etag']
+    if entry and entry['last_modified']:
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+
+def store_page(url, entry, response):
+    """
+    This function decodes a response (requests or httpx) to a page request,
+    reusing the stale cache entry for 304 Not Modified, and caches it.
+    """
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    if entry and response.status_code == 304:
+        # a 304 usually doesn't repeat the validators of the cached page
+        page = entry['page']
+        etag = etag or entry['etag']
+        last_modified = last_modified or entry['last_modified']
+    else:
+        response.raise_for_status()
+        page = response.json()
+    key = "google_books:" + hashlib.sha256(url.encode()).hexdigest()
+    caches['google_books'].set(key, {
+        "page": page,
+        "etag": etag,
+        "last_modified": last_modified,
+        "fetched": time.time(),
+    })
+    return page
+
+
+def fetch_page(session, url, refresh=False):
+    """
+    This function fetches and decodes a single page of Google Books API
+    search results. Pages are served from the response cache while fresh
+    and revalidated with ETag/Last-Modified once stale. With refresh=True
+    the cached page is ignored and replaced. Connecting and reading time
+    out after google_books_timeout seconds.
+    """
+    page, entry = cached_page(url, refresh)
+    if page is not None:
+        return page
+    response = session.get(url, headers=revalidation_headers(entry),
+                           timeout=google_books_timeout)
+    return store_page(url, entry, response)
+
+
+async def afetch_page(client, url, refresh=False):
+    """
+    This function is an asynchronous version of fetch_page using an httpx
+    client.
+    """
+    page, entry = await sync_to_async(cached_page)(url, refresh)
+    if page is not None:
+        return page
+    response = await client.get(url, headers=revalidation_headers(entry),
+                                timeout=google_books_timeout)
+    return await sync_to_async(store_page)(url, entry, response)
+
+
+def collect_volumes(pages):
+    """
+    This function returns volumes of all pages in order, without volumes
+    repeated across pages.
+    """
+    google_books_data = {}
+    for page in pages:
+        for entry in page.get('items', []):
+            google_books_data.setdefault(entry['id'], entry)
+
+    return list(google_books_data.values())
+
+
+def iter_author_pages(start_indexes, google_books_url=google_books,
+                      max_concurrency=google_books_max_concurrency,
+                      fetch_size=40, refresh=False):
+    """
+    This function yields (author, startIndex, page) triples of Google Books
+    API search results of several authors, beginning with the startIndex
+    given for every author in the start_indexes dictionary. Pages of all
+    authors are fetched in parallel over a pooled session with at most
+    max_concurrency requests in flight in total, and yielded as they
+    arrive, so pages of an author may come out of order.
+    """
+    with requests.Session() as session, \
+            ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max_concurrency)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        queue = deque((author, index, True) for author, index in
+                      start_indexes.items())
+        running = {}
         try:
-            info["published_year"] = int(pub_date)
-        except TypeError:
+            while queue or running:
+                while queue and len(running) < max_concurrency:
+                    author, index, first = queue.popleft()
+                    url = volumes_url(google_books_url, author, fetch_size,
+                                      index)
+                    future = executor.submit(fetch_page, session, url,
+                                             refresh)
+                    running[future] = (author, index, first)
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    author, index, first = running.pop(future)
+                    page = future.result()
+                    if first:
+                        queue.extend((author, later, False) for later in range(
+                            index + fetch_size, page.get('totalItems', 0),
+                            fetch_size))
+                    yield author, index, page
+        finally:
+            for future in running:
+                future.cancel()
+
+
+async def aiter_author_pages(start_indexes, google_books_url=google_books,
+                             max_concurrency=google_books_max_concurrency,
+                             fetch_size=40, refresh=False):
+    """
+    This function is an asynchronous version of iter_author_pages, fetching
+    pages with an httpx client on the event loop instead of worker threads.
+    """
+    limits = httpx.Limits(max_connections=max_concurrency)
+    async with httpx.AsyncClient(limits=limits) as client:
+        queue = deque((author, index, True) for author, index in
+                      start_indexes.items())
+        running = {}
+        try:
+            while queue or running:
+                while queue and len(running) < max_concurrency:
+                    author, index, first = queue.popleft()
+                    url = volumes_url(google_books_url, author, fetch_size,
+                                      index)
+                    task = asyncio.ensure_future(afetch_page(client, url,
+                                                             refresh))
+                    running[task] = (author, index, first)
+                done, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    author, index, first = running.pop(task)
+                    page = task.result()
+                    if first:
+                        queue.extend((author, later, False) for later in range(
+                            index + fetch_size, page.get('totalItems', 0),
+                            fetch_size))
+                    yield author, index, page
+        finally:
+            for task in running:
+                task.cancel()
+
+
+def fetch_books(author, google_books_url=google_books,
+                max_concurrency=google_books_max_concurrency,
+                fetch_size=40, refresh=False):
+    """
+    This function imports data about books for requested author from Google
+    Books API, fetching pages with iter_author_pages, and returns volumes
+    of all pages in order. With refresh=True cached pages are refetched.
+    """
+    pages = sorted(((index, page) for _, index, page in iter_author_pages(
+        {author: 0}, google_books_url, max_concurrency, fetch_size,
+        refresh)), key=lambda item: item[0])
+    return collect_volumes(page for _, page in pages)
+
+
+def format_volume(entry):
+    """
+    This function formats a single Google Books API volume into a dictionary
+    of Book fields.
+    """
+    volume = entry['volumeInfo']
+    image_links = volume.get('imageLinks') if \
+                  'imageLinks' in volume else None
+    thumbnail = image_links["thumbnail"] if image_links else None
+    info = {"external_id": entry.get("id"),
+            "title": volume.get("title"),
+            "authors": volume.get("authors") or [],
+            "thumbnail": thumbnail
+            }
+    pub_date = volume.get('publishedDate')
+    try:
+        info["published_year"] = int(pub_date)
+    except TypeError:
+        info["published_year"] = 0
+    except ValueError:
+        if pub_date[0:min(4, len(pub_date))].isalnum():
+            info["published_year"] = pub_date[0:min(4, len(pub_date))]
+        else:
             info["published_year"] = 0
-        except ValueError:
-            if pub_date[0:min(4, len(pub_date))].isalnum():
-                info["published_year"] = pub_date[0:min(4, len(pub_date))]
-            else:
-                info["published_year"] = 0
-        if info['authors']:
-            for author in info['authors']:
-                try:
-                    Author.objects.filter(name=author).first().name
-                except AttributeError:
-                    new_author = Author(name=author)
-                    new_author.save()
-            authors_list = [Author.objects.filter(name=author).first() for
-                            author in info['authors']]
-        book = Book.objects.filter(external_id=info['external_id']).first()
+    return info
+
+
+def volume_fingerprint(info):
+    """
+    This function returns a hash of the content of a formatted volume
+    stored with imported books: title, authors, published year and
+    thumbnail.
+    """
+    content = json.dumps([info['title'], list(dict.fromkeys(info['authors'])),
+                          str(info['published_year']), info['thumbnail']])
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def find_manual_books(volumes):
+    """
+    This function returns a dictionary mapping external ids of given volumes
+    to manually inserted books (without external_id) with the same title,
+    published year and authors.
+    """
+    candidates = Book.objects.filter(
+        external_id=None, title__in={info['title'] for info in volumes})
+    if all(info['authors'] for info in volumes):
+        candidates = book_queries.get_books_by_authors(
+            {name for info in volumes for name in info['authors']},
+            candidates, match='any')
+    candidates = book_queries.prefetch_authors(candidates)
+    by_title = {}
+    for book in candidates:
+        key = (book.title, book.published_year)
+        by_title.setdefault(key, []).append(book)
+
+    matches = {}
+    for info in volumes:
+        key = (info['title'], int(info['published_year']))
+        for book in by_title.get(key, []):
+            names = {author.name for author in book.authors.all()}
+            if set(info['authors']) <= names:
+                matches[info['external_id']] = book
+                by_title[key].remove(book)
+                break
+    return matches
+
+
+def save_volumes(volumes):
+    """
+    This function upserts books for given formatted volumes by external_id
+    using set-based queries and returns the numbers of inserted, updated
+    and unchanged books. Books whose stored fingerprint matches the volume
+    aren't written at all. New books get 'acquired' from volumes which
+    have it.
+    """
+    existing = {book.external_id: book for book in Book.objects.filter(
+        external_id__in=[info['external_id'] for info in volumes])
+        .only('id', 'external_id', 'fingerprint')}
+    fingerprints = {info['external_id']: volume_fingerprint(info)
+                    for info in volumes}
+    unchanged = [info for info in volumes
+                 if info['external_id'] in existing and
+                 existing[info['external_id']].fingerprint ==
+                 fingerprints[info['external_id']]]
+    if unchanged:
+        skip = {info['external_id'] for info in unchanged}
+        volumes = [info for info in volumes if info['external_id'] not in skip]
+    if not volumes:
+        return {"inserted": 0, "updated": 0, "unchanged": len(unchanged)}
+
+    authors = book_queries.get_or_create_authors(
+        name for info in volumes for name in info['authors'])
+    manual = find_manual_books(
+        [info for info in volumes if info['external_id'] not in existing])
+
+    updated, matched, created = [], [], []
+    for info in volumes:
+        book = existing.get(info['external_id'])
         if book:
             # filter by external_id, if matches overwrite all fields
-            book.external_id = info['external_id']
             book.title = info['title']
             book.published_year = info['published_year']
             book.thumbnail = info['thumbnail']
-            book.authors.clear()  # reset all data about authors
-            for author in authors_list:
-                book.authors.add(author.id)
+            book.fingerprint = fingerprints[info['external_id']]
+            updated.append(book)
+        elif info['external_id'] in manual:
+            # update manually inserted book, its authors are kept, so it
+            # gets no fingerprint and is fully updated by the next import
+            book = manual[info['external_id']]
+            book.external_id = info['external_id']
+            book.thumbnail = info['thumbnail']
+            matched.append(book)
         else:
-            query = book_queries.get_books_by_authors(authors=authors_list)
-            book = query.filter(title=info['title'],
-                                published_year=info['published_year']).first()
-            if book:
-                # update manually inserted book
-                book.external_id = info['external_id']
-                book.thumbnail = info['thumbnail']
-            else:
-                # create entirely new book
-                book = Book(external_id=info['external_id'],
-                            title=info['title'],
-                            published_year=info['published_year'],
-                            thumbnail=info['thumbnail'])
-                # Book instance needs to have a value for field "id"
-                # before this many-to-many relationship can be used
-                book.save()
-                for author in authors_list:
-                    book.authors.add(author.id)
-        book.save()
-
-    counter = {
-        "imported": len(google_books_data)
-    }
+            # create entirely new book
+            created.append(Book(external_id=info['external_id'],
+                                title=info['title'],
+                                published_year=info['published_year'],
+                                thumbnail=info['thumbnail'],
+                                acquired=info.get('acquired', False),
+                                fingerprint=fingerprints[
+                                    info['external_id']]))
+
+    lock_books([book.pk for book in updated])
+    remove_books([book.pk for book in updated])
+    Book.objects.bulk_update(updated, ['title', 'published_year',
+                                       'thumbnail', 'fingerprint'])
+    Book.objects.bulk_update(matched, ['external_id', 'thumbnail'])
+    Book.objects.bulk_create(created)
+    if any(book.pk is None for book in created):
+        # Some database backends don't return primary keys of bulk inserts
+        ids = {book.external_id: book.pk for book in Book.objects.filter(
+            external_id__in=[book.external_id for book in created])}
+        for book in created:
+            book.pk = ids[book.external_id]
+
+    # reset all data about authors of imported books
+    book_authors = Book.authors.through
+    book_authors.objects.filter(
+        book_id__in=[book.pk for book in updated]).delete()
+    volume_authors = {info['external_id']: info['authors']
+                      for info in volumes}
+    book_authors.objects.bulk_create([
+        book_authors(book_id=book.pk, author_id=authors[name].pk)
+        for book in updated + created
+        for name in dict.fromkeys(volume_authors[book.external_id])
+    ])
+    book_queries.refresh_fragments(
+        book.pk for book in updated + matched + created)
+    add_books([book.pk for book in updated + created])
+    return {"inserted": len(created), "updated": len(updated + matched),
+            "unchanged": len(unchanged)}
+
+
+def parse_google_books_into_db(google_books_data, batch_size=500):
+    """
+    This function processes and formats given data, creates Book models
+    based on these data and returns the numbers of imported (new), updated
+    and unchanged books as a dictionary. Every batch of volumes is written
+    in a single transaction.
+    """
+    volumes = {}
+    for entry in google_books_data:
+        info = format_volume(entry)
+        volumes[info['external_id']] = info
+    volumes = list(volumes.values())
+
+    counter = {"imported": 0, "updated": 0, "unchanged": 0}
+    for start in range(0, len(volumes), batch_size):
+        batch = volumes[start:start + batch_size]
+        with transaction.atomic():
+            saved = save_volumes(batch)
+        if saved['inserted'] or saved['updated']:
+            bump_catalogue_generation()
+        counter['imported'] += saved['inserted']
+        counter['updated'] += saved['updated']
+        counter['unchanged'] += saved['unchanged']
 
     return counter
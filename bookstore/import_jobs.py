@@ -0,0 +1,265 @@
+"""
+This module provides a local worker pool running Google Books imports
+in the background and recording their progress in ImportJob models.
+Pages of all of a job's authors are fetched in parallel and every page is
+saved as soon as it arrives, together with the job's progress, so a failed
+job can be resumed after the last saved pages. Every run of a job claims
+it and writes its progress only while nobody else has claimed it since, so
+a resumed job never runs twice.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from api_challenge.settings import import_workers, import_job_timeout
+from .google_api_handler import aiter_author_pages, iter_author_pages, \
+    parse_google_books_into_db
+from .models import ImportJob
+
+FETCH_SIZE = 40
+COUNTS = ('imported', 'updated', 'unchanged', 'duplicates')
+
+executor = ThreadPoolExecutor(max_workers=import_workers,
+                              thread_name_prefix='import')
+# references to running asynchronous imports, so they aren't collected
+tasks = set()
+
+
+class JobSuperseded(Exception):
+    """
+    An class for handling exceptions caused by a run of a job which was
+    claimed by another run, e.g. after the job was resumed.
+    """
+
+
+class ImportProgress:
+    """
+    A class tracking counts and saved pages of every author of a running
+    job and volumes already seen, which are skipped as duplicates when
+    another author's page brings them again.
+    """
+    def __init__(self, job):
+        self.job_id = job.id
+        # the job's 'updated' as last written by this run
+        self.updated = job.updated
+        self.progress = job.progress or {}
+        for author in job.authors:
+            self.progress.setdefault(author, dict(
+                {"next_start_index": 0, "finished": False},
+                **{name: 0 for name in COUNTS}))
+        # pages saved after a page which is still missing, by author
+        self.saved_pages = {author: set() for author in job.authors}
+        self.seen = set()
+
+    def start_indexes(self):
+        """Return the startIndex to fetch first for unfinished authors."""
+        return {author: progress['next_start_index'] for author, progress
+                in self.progress.items() if not progress['finished']}
+
+    def counts(self):
+        """Return counts summed over all authors."""
+        return {name: sum(progress[name] for progress in
+                          self.progress.values()) for name in COUNTS}
+
+    def save_page(self, author, start_index, page):
+        """
+        Save volumes of a fetched page not seen in the job yet and the job's
+        progress in a single transaction.
+        """
+        volumes = []
+        progress = self.progress[author]
+        for entry in page.get('items', []):
+            if entry['id'] in self.seen:
+                progress['duplicates'] += 1
+            else:
+                self.seen.add(entry['id'])
+                volumes.append(entry)
+
+        saved_pages = self.saved_pages[author]
+        saved_pages.add(start_index)
+        while progress['next_start_index'] in saved_pages:
+            saved_pages.remove(progress['next_start_index'])
+            progress['next_start_index'] += FETCH_SIZE
+        progress['finished'] = \
+            progress['next_start_index'] >= page.get('totalItems', 0)
+
+        with transaction.atomic():
+            saved = parse_google_books_into_db(volumes)
+            for name, count in saved.items():
+                progress[name] += count
+            self.update(pages_fetched=F('pages_fetched') + 1,
+                        books_written=F('books_written') +
+                        saved['imported'] + saved['updated'],
+                        progress=self.progress, counts=self.counts())
+
+    def update(self, **fields):
+        """
+        Update the job if no other run claimed it since this run's last
+        update, or raise JobSuperseded, rolling back the transaction.
+        """
+        updated = timezone.now()
+        if not ImportJob.objects.filter(
+                id=self.job_id, state=ImportJob.RUNNING,
+                updated=self.updated).update(updated=updated, **fields):
+            raise JobSuperseded
+        self.updated = updated
+
+
+def start_job(job_id, submitted):
+    """
+    This function claims a pending job submitted with the given 'updated',
+    marks it as running and returns its progress so far. It raises
+    JobSuperseded if the job was claimed or resumed since.
+    """
+    jobs = ImportJob.objects.filter(id=job_id)
+    if not jobs.filter(state=ImportJob.PENDING, updated=submitted).update(
+            state=ImportJob.RUNNING, error=None, updated=timezone.now()):
+        raise JobSuperseded
+    job = jobs.get()
+    return job, ImportProgress(job)
+
+
+def fail_job(progress, error):
+    """This function marks a job as failed with the error's message, unless
+    another run claimed it."""
+    try:
+        progress.update(state=ImportJob.FAILED, error=str(error))
+    except JobSuperseded:
+        pass
+
+
+def finish_job(progress):
+    """This function marks a job as finished with its final counts."""
+    progress.update(state=ImportJob.FINISHED, counts=progress.counts())
+
+
+def run_import_job(job_id, submitted):
+    """
+    This function fetches and saves books for the job's authors page by
+    page, starting at every author's next_start_index. It returns None if
+    another run claimed the job.
+    """
+    try:
+        job, progress = start_job(job_id, submitted)
+    except JobSuperseded:
+        return None
+    try:
+        for author, start_index, page in iter_author_pages(
+                progress.start_indexes(), fetch_size=FETCH_SIZE,
+                refresh=job.refresh):
+            progress.save_page(author, start_index, page)
+        finish_job(progress)
+    except JobSuperseded:
+        return None
+    except Exception as error:  # pylint: disable=broad-except
+        fail_job(progress, error)
+        raise
+    return progress.counts()
+
+
+def run_in_worker(job_id, submitted):
+    """
+    This function runs an import job in a worker thread and releases
+    the thread's database connections afterwards.
+    """
+    try:
+        return run_import_job(job_id, submitted)
+    finally:
+        connections.close_all()
+
+
+def create_job(authors, refresh=False):
+    """
+    This function creates an ImportJob for a list of authors.
+    """
+    return ImportJob.objects.create(author=", ".join(authors)[:100],
+                                    authors=authors, refresh=refresh)
+
+
+def submit_job(job):
+    """
+    This function submits a job to the worker pool once it is committed.
+    """
+    transaction.on_commit(
+        lambda: executor.submit(run_in_worker, job.id, job.updated))
+
+
+def enqueue_import(authors, refresh=False):
+    """
+    This function creates an ImportJob for requested authors and submits it
+    to the worker pool once the job is committed. With refresh=True cached
+    Google Books responses are bypassed.
+    """
+    job = create_job(authors, refresh)
+    submit_job(job)
+    return job
+
+
+def resumable(job):
+    """
+    This function checks whether a job can be resumed: it failed, or it is
+    running without progress for import_job_timeout seconds, because its
+    worker died. Pending jobs may still wait in the worker pool's queue.
+    """
+    if job.state == ImportJob.FAILED:
+        return True
+    stalled = timezone.now() - timedelta(seconds=import_job_timeout)
+    return job.state == ImportJob.RUNNING and job.updated < stalled
+
+
+def resume_import(job):
+    """
+    This function submits a failed or stalled job to the worker pool again.
+    It continues after the last saved pages. Claiming the job stops a run
+    which only stalled from writing again. It returns None if the job can't
+    be resumed or another request has just resumed it.
+    """
+    if not resumable(job):
+        return None
+    claimed = ImportJob.objects.filter(
+        id=job.id, state=job.state, updated=job.updated).update(
+        state=ImportJob.PENDING, updated=timezone.now())
+    if not claimed:
+        return None
+    job.refresh_from_db()
+    submit_job(job)
+    return job
+
+
+async def arun_import_job(job_id, submitted):
+    """
+    This function is an asynchronous version of run_import_job. Pages are
+    fetched on the event loop, only database writes run in a thread.
+    """
+    try:
+        job, progress = await sync_to_async(start_job)(job_id, submitted)
+    except JobSuperseded:
+        return None
+    try:
+        async for author, start_index, page in aiter_author_pages(
+                progress.start_indexes(), fetch_size=FETCH_SIZE,
+                refresh=job.refresh):
+            await sync_to_async(progress.save_page)(author, start_index, page)
+        await sync_to_async(finish_job)(progress)
+    except JobSuperseded:
+        return None
+    except Exception as error:  # pylint: disable=broad-except
+        await sync_to_async(fail_job)(progress, error)
+        raise
+    return progress.counts()
+
+
+async def aenqueue_import(authors, refresh=False):
+    """
+    This function creates an ImportJob for requested authors and runs it as
+    a task on the running event loop.
+    """
+    job = await sync_to_async(create_job)(authors, refresh)
+    task = asyncio.create_task(arun_import_job(job.id, job.updated))
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
+    return job
@@ -0,0 +1,82 @@
+"""
+A management command running the Bookstore microbenchmark suite in
+a temporary test database.
+"""
+
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from bookstore.benchmarks import run_benchmarks, compare_results
+
+
+class Command(BaseCommand):
+    """
+    A class for the 'benchmark' management command.
+    """
+    help = "Time book queries, serialization and Google Books import " \
+           "against a synthetic catalogue."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--authors', type=int, default=1000,
+                            help="Size of the pool of authors.")
+        parser.add_argument('--authors-per-book', type=int, default=2,
+                            help="Maximum number of authors of a book.")
+        parser.add_argument('--years', default='1900-2022',
+                            help="Range of publication years, e.g. 1900-2022.")
+        parser.add_argument('--distribution', default='uniform',
+                            choices=['uniform', 'recent'],
+                            help="Distribution of publication years.")
+        parser.add_argument('--import-volumes', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--save', metavar='PATH',
+                            help="Save results as a baseline JSON file.")
+        parser.add_argument('--compare', metavar='PATH',
+                            help="Compare results with a baseline file.")
+        parser.add_argument('--threshold', type=float, default=0.1,
+                            help="Relative change reported as regression.")
+
+    def handle(self, *args, **options):
+        try:
+            first, last = (int(year) for year in options['years'].split('-'))
+        except ValueError as error:
+            raise CommandError("--years must look like 1900-2022") from error
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = run_benchmarks(
+                books=options['books'], authors=options['authors'],
+                authors_per_book=options['authors_per_book'],
+                years=(first, last), distribution=options['distribution'],
+                import_volumes=options['import_volumes'],
+                repeat=options['repeat'], seed=options['seed'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        for name, metrics in results.items():
+            self.stdout.write(
+                f"{name:<28} {metrics['wall_time'] * 1000:>10.2f} ms "
+                f"{metrics['queries']:>6} queries "
+                f"{metrics['peak_memory'] / 1024:>10.1f} KiB")
+
+        if options['save']:
+            with open(options['save'], 'w', encoding='utf-8') as baseline:
+                json.dump(results, baseline, indent=4)
+            self.stdout.write(f"Baseline saved to {options['save']}")
+
+        if options['compare']:
+            with open(options['compare'], 'r', encoding='utf-8') as baseline:
+                rows = compare_results(results, json.load(baseline),
+                                       options['threshold'])
+            regressions = [row for row in rows if row[5]]
+            for name, metric, previous, current, change, regressed in rows:
+                line = f"{name:<28} {metric:<12} {previous:>14.4f} -> " \
+                       f"{current:>14.4f} ({change:+.1%})"
+                self.stdout.write(self.style.ERROR(line) if regressed
+                                  else line)
+            if regressions:
+                raise CommandError(
+                    f"{len(regressions)} metric(s) regressed by more than "
+                    f"{options['threshold']:.0%}")
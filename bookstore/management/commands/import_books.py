@@ -0,0 +1,34 @@
+"""
+A management command importing books from an NDJSON or CSV file shaped
+like sample_database.json.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from bookstore.file_import import import_file
+
+
+class Command(BaseCommand):
+    """
+    A class for the 'import_books' management command.
+    """
+    help = "Import books from an NDJSON or CSV file in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['ndjson', 'csv'],
+                            help="File format, by default guessed from "
+                                 "the file extension.")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or \
+            ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        try:
+            with open(path, 'rb') as lines:
+                counts = import_file(lines, file_format,
+                                     options['batch_size'])
+        except OSError as error:
+            raise CommandError(f"Can't read {path}: {error}") from error
+        self.stdout.write(", ".join(
+            f"{name}: {count}" for name, count in counts.items()))
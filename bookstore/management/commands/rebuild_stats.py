@@ -0,0 +1,19 @@
+"""
+A management command recounting the catalogue statistics counters.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from bookstore.stats import rebuild_counts
+
+
+class Command(BaseCommand):
+    """
+    A class for the 'rebuild_stats' management command.
+    """
+    help = "Recount statistics of books served at GET /books/stats."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_counts()
+        self.stdout.write("Statistics rebuilt.")
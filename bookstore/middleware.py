@@ -0,0 +1,157 @@
+"""
+This module provides opt-in middleware measuring SQL, serialization and
+rendering time of every request.
+"""
+
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from django.db import connections
+from api_challenge.settings import slow_request_ms
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of request duration histogram buckets in milliseconds
+BUCKETS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf')]
+SLOWEST_QUERIES = 5
+
+current_metrics = contextvars.ContextVar('current_metrics', default=None)
+endpoint_stats = {}
+stats_lock = threading.Lock()
+
+
+class RequestMetrics:
+    """
+    A class collecting timings of a single request.
+    """
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.render_time = 0.0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        """Time a database query, used as a connection execute wrapper."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.queries += 1
+            self.sql_time += duration
+            self.statements.append((duration, sql))
+
+    def slowest_statements(self):
+        """Return the slowest SQL statements with their durations."""
+        return sorted(self.statements, reverse=True)[:SLOWEST_QUERIES]
+
+
+@contextmanager
+def timer(name):
+    """
+    Add the time spent in the block to the current request's '<name>_time'
+    metric, if metrics are collected.
+    """
+    metrics = current_metrics.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            duration = time.perf_counter() - start
+            setattr(metrics, f'{name}_time',
+                    getattr(metrics, f'{name}_time') + duration)
+
+
+def record_endpoint(endpoint, metrics, total):
+    """Add a finished request to the endpoint's aggregated statistics."""
+    with stats_lock:
+        stats = endpoint_stats.setdefault(endpoint, {
+            "requests": 0,
+            "queries": 0,
+            "sql_ms": 0.0,
+            "serializer_ms": 0.0,
+            "render_ms": 0.0,
+            "total_ms": 0.0,
+            "histogram": [0] * len(BUCKETS),
+        })
+        stats["requests"] += 1
+        stats["queries"] += metrics.queries
+        stats["sql_ms"] += metrics.sql_time * 1000
+        stats["serializer_ms"] += metrics.serializer_time * 1000
+        stats["render_ms"] += metrics.render_time * 1000
+        stats["total_ms"] += total * 1000
+        stats["histogram"][bisect.bisect_left(BUCKETS, total * 1000)] += 1
+
+
+def get_endpoint_stats():
+    """Return a copy of aggregated statistics of all endpoints."""
+    with stats_lock:
+        return {
+            endpoint: dict(stats, histogram=dict(zip(
+                [str(bucket) for bucket in BUCKETS], stats["histogram"])))
+            for endpoint, stats in endpoint_stats.items()
+        }
+
+
+class RequestMetricsMiddleware:
+    """
+    A middleware class emitting a Server-Timing header with query count,
+    SQL, serializer and render time of every request, logging requests
+    slower than settings.slow_request_ms and aggregating per-endpoint
+    statistics.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        total = time.perf_counter() - start
+
+        response['Server-Timing'] = ", ".join([
+            f'db;dur={metrics.sql_time * 1000:.2f};'
+            f'desc="{metrics.queries} queries"',
+            f'serializer;dur={metrics.serializer_time * 1000:.2f}',
+            f'render;dur={metrics.render_time * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ])
+
+        match = request.resolver_match
+        route = match.route if match else '<unmatched>'
+        endpoint = f"{request.method} /{route}"
+        record_endpoint(endpoint, metrics, total)
+        if total * 1000 > slow_request_ms:
+            logger.warning(
+                "Slow request %s %s: %.2f ms, %d queries (%.2f ms)%s",
+                request.method, request.get_full_path(), total * 1000,
+                metrics.queries, metrics.sql_time * 1000,
+                "".join(f"\n  {duration * 1000:.2f} ms: {sql}" for
+                        duration, sql in metrics.slowest_statements()))
+        return response
+
+    def process_template_response(self, request, response):
+        """Time rendering of DRF and template responses."""
+        metrics = current_metrics.get()
+        if metrics is None:
+            return response
+        render = response.render
+
+        def timed_render():
+            with timer('render'):
+                return render()
+        response.render = timed_render
+        return response
+
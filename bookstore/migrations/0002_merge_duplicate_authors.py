@@ -0,0 +1,66 @@
+# Generated by Django 4.0.4 on 2026-10-18 04:30
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_authors(apps, schema_editor):
+    """
+    Merge authors sharing the same name into the one with the lowest id,
+    so that a unique constraint can be applied to Author.name.
+    """
+    Author = apps.get_model('bookstore', 'Author')
+    BookAuthors = apps.get_model('bookstore', 'Book').authors.through
+    db_alias = schema_editor.connection.alias
+    authors = Author.objects.using(db_alias)
+    links = BookAuthors.objects.using(db_alias)
+
+    duplicates = (authors.values('name')
+                  .annotate(count=Count('id'), keep_id=Min('id'))
+                  .filter(count__gt=1))
+    for duplicate in duplicates:
+        keep_id = duplicate['keep_id']
+        other_ids = list(authors.filter(name=duplicate['name'])
+                         .exclude(id=keep_id).values_list('id', flat=True))
+        linked = set(links.filter(author_id=keep_id)
+                     .values_list('book_id', flat=True))
+        for link in links.filter(author_id__in=other_ids):
+            if link.book_id in linked:
+                link.delete(using=db_alias)
+            else:
+                link.author_id = keep_id
+                link.save(using=db_alias)
+                linked.add(link.book_id)
+        authors.filter(id__in=other_ids).delete()
+
+
+def clear_duplicate_external_ids(apps, schema_editor):
+    """
+    Keep external_id only on the oldest book of every duplicated volume,
+    so that a unique constraint can be applied to Book.external_id.
+    """
+    Book = apps.get_model('bookstore', 'Book')
+    db_alias = schema_editor.connection.alias
+    books = Book.objects.using(db_alias)
+
+    duplicates = (books.exclude(external_id=None)
+                  .values('external_id')
+                  .annotate(count=Count('id'), keep_id=Min('id'))
+                  .filter(count__gt=1))
+    for duplicate in duplicates:
+        (books.filter(external_id=duplicate['external_id'])
+         .exclude(id=duplicate['keep_id']).update(external_id=None))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_authors,
+                             migrations.RunPython.noop),
+        migrations.RunPython(clear_duplicate_external_ids,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.0.4 on 2026-10-18 04:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore', '0002_merge_duplicate_authors'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='author',
+            name='name',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='external_id',
+            field=models.CharField(max_length=200, null=True,
+                                   unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['title', 'published_year'],
+                               name='bookstore_b_title_1acd3f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['published_year', 'id'],
+                               name='bookstore_b_publish_7c6b0e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['acquired', 'id'],
+                               name='bookstore_b_acquire_90aed3_idx'),
+        ),
+    ]
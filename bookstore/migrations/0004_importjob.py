@@ -0,0 +1,33 @@
+# Generated by Django 4.0.4 on 2026-10-18 04:37
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore', '0003_alter_author_name_alter_book_external_id_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False,
+                                        primary_key=True, serialize=False)),
+                ('author', models.CharField(max_length=100)),
+                ('state', models.CharField(choices=[('pending', 'Pending'),
+                                                    ('running', 'Running'),
+                                                    ('finished', 'Finished'),
+                                                    ('failed', 'Failed')],
+                                           default='pending', max_length=10)),
+                ('pages_fetched', models.IntegerField(default=0)),
+                ('books_written', models.IntegerField(default=0)),
+                ('counts', models.JSONField(null=True)),
+                ('error', models.TextField(null=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.4 on 2026-10-18 04:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore', '0004_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='refresh',
+            field=models.BooleanField(default=False),
+        ),
+    ]
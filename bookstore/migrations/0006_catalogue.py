@@ -0,0 +1,32 @@
+# Generated by Django 4.0.4 on 2026-10-18 04:47
+
+from django.db import migrations, models
+
+
+def create_catalogue(apps, schema_editor):
+    """
+    Create the single row holding the catalogue generation.
+    """
+    Catalogue = apps.get_model('bookstore', 'Catalogue')
+    db_alias = schema_editor.connection.alias
+    Catalogue.objects.using(db_alias).get_or_create(id=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore', '0005_importjob_refresh'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Catalogue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True,
+                                           serialize=False,
+                                           verbose_name='ID')),
+                ('generation', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_catalogue, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.0.4 on 2026-10-18 04:49
+
+import json
+from django.db import migrations, models
+
+
+def render_fragments(apps, schema_editor):
+    """
+    Store the JSON representation of every existing book, in the format
+    of BookSerializer.
+    """
+    Book = apps.get_model('bookstore', 'Book')
+    db_alias = schema_editor.connection.alias
+    books = list(Book.objects.using(db_alias).prefetch_related('authors'))
+    for book in books:
+        book.fragment = json.dumps({
+            "id": book.id,
+            "external_id": book.external_id,
+            "title": book.title,
+            "authors": [author.name for author in book.authors.all()],
+            "acquired": book.acquired,
+            "published_year": book.published_year,
+            "thumbnail": book.thumbnail,
+        }, ensure_ascii=False, separators=(',', ':'))
+    Book.objects.using(db_alias).bulk_update(books, ['fragment'],
+                                             batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore', '0006_catalogue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='fragment',
+            field=models.TextField(editable=False, null=True),
+        ),
+        migrations.RunPython(render_fragments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.4 on 2026-10-18 05:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore', '0007_book_fragment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='fingerprint',
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.4 on 2026-10-18 05:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore', '0008_book_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='next_start_index',
+            field=models.IntegerField(default=0),
+        ),
+    ]
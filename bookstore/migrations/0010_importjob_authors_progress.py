@@ -0,0 +1,51 @@
+# Generated by Django 4.0.4 on 2026-10-18 05:03
+
+from django.db import migrations, models
+
+
+def copy_progress(apps, schema_editor):
+    """
+    Record the author and the progress of existing single author jobs
+    in the new per-author fields.
+    """
+    ImportJob = apps.get_model('bookstore', 'ImportJob')
+    db_alias = schema_editor.connection.alias
+    jobs = list(ImportJob.objects.using(db_alias))
+    for job in jobs:
+        counts = job.counts or {}
+        job.authors = [job.author]
+        job.progress = {job.author: {
+            "next_start_index": job.next_start_index,
+            "finished": job.state == 'finished',
+            "imported": counts.get('imported', 0),
+            "updated": counts.get('updated', 0),
+            "unchanged": counts.get('unchanged', 0),
+            "duplicates": 0,
+        }}
+    ImportJob.objects.using(db_alias).bulk_update(
+        jobs, ['authors', 'progress'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore', '0009_importjob_next_start_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='authors',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='progress',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.RunPython(copy_progress, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='importjob',
+            name='next_start_index',
+        ),
+    ]
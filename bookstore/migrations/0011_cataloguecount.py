@@ -0,0 +1,58 @@
+# Generated by Django 4.0.4 on 2026-10-18 05:05
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_catalogue(apps, schema_editor):
+    """
+    Fill the counters from existing books.
+    """
+    Book = apps.get_model('bookstore', 'Book')
+    CatalogueCount = apps.get_model('bookstore', 'CatalogueCount')
+    db_alias = schema_editor.connection.alias
+    books = Book.objects.using(db_alias)
+    links = Book.authors.through.objects.using(db_alias)
+    acquired = Count('id', filter=Q(acquired=True))
+    counts = [CatalogueCount(dimension='all', value='',
+                             **books.aggregate(books=Count('id'),
+                                               acquired=acquired))]
+    counts += [CatalogueCount(dimension='year',
+                              value=str(row['published_year']),
+                              books=row['books'], acquired=row['acquired'])
+               for row in books.order_by().values('published_year')
+               .annotate(books=Count('id'), acquired=acquired)]
+    counts += [CatalogueCount(dimension='author',
+                              value=str(row['author_id']),
+                              books=row['books'], acquired=row['acquired'])
+               for row in links.order_by()
+               .values('author_id').annotate(
+                   books=Count('id'),
+                   acquired=Count('id', filter=Q(book__acquired=True)))]
+    CatalogueCount.objects.using(db_alias).bulk_create(counts,
+                                                       batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore', '0010_importjob_authors_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogueCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(max_length=10)),
+                ('value', models.CharField(blank=True, max_length=20)),
+                ('books', models.BigIntegerField(default=0)),
+                ('acquired', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='cataloguecount',
+            constraint=models.UniqueConstraint(fields=('dimension', 'value'), name='unique_catalogue_count'),
+        ),
+        migrations.RunPython(count_catalogue, migrations.RunPython.noop),
+    ]
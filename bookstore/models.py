@@ -2,6 +2,7 @@
 This module provides models for Bookstore database.
 """
 
+import uuid
 from django.db import models
 
 
@@ -9,7 +10,7 @@ class Author(models.Model):
     """
     A model for Author objects.
     """
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, unique=True)
 
     def __str__(self):
         return str(self.name)
@@ -20,12 +21,93 @@ class Book(models.Model):
     A model for Book objects.
     """
     id = models.AutoField(primary_key=True)
-    external_id = models.CharField(max_length=200, null=True)
+    external_id = models.CharField(max_length=200, null=True, unique=True)
     title = models.CharField(max_length=200)
     authors = models.ManyToManyField(Author)
     acquired = models.BooleanField(default=False)
     published_year = models.IntegerField()
     thumbnail = models.URLField(null=True)
+    # BookSerializer representation stored as JSON for the list view
+    fragment = models.TextField(null=True, editable=False)
+    # hash of the imported volume's content, unchanged volumes aren't written
+    fingerprint = models.CharField(max_length=64, null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # exact title lookups (POST /books/ dedupe, import matching)
+            models.Index(fields=['title', 'published_year']),
+            # 'from'/'to' range filters walked in keyset (id) order
+            models.Index(fields=['published_year', 'id']),
+            models.Index(fields=['acquired', 'id']),
+        ]
 
     def __str__(self):
         return str(self.title)
+
+
+class Catalogue(models.Model):
+    """
+    A model for the catalogue generation, a counter bumped on every change
+    of books and used to invalidate cached responses and ETags.
+    """
+    generation = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return str(self.generation)
+
+
+class CatalogueCount(models.Model):
+    """
+    A model for counters of books and acquired books in the whole catalogue
+    (dimension 'all'), of a published year ('year') or of an author
+    ('author', by id), updated with every change of books.
+    """
+    ALL = 'all'
+    YEAR = 'year'
+    AUTHOR = 'author'
+
+    dimension = models.CharField(max_length=10)
+    value = models.CharField(max_length=20, blank=True)
+    books = models.BigIntegerField(default=0)
+    acquired = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'value'],
+                                    name='unique_catalogue_count'),
+        ]
+
+    def __str__(self):
+        return f"{self.dimension} {self.value}: {self.books}"
+
+
+class ImportJob(models.Model):
+    """
+    A model for background Google Books import jobs.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FINISHED = 'finished'
+    FAILED = 'failed'
+    STATES = [(PENDING, 'Pending'), (RUNNING, 'Running'),
+              (FINISHED, 'Finished'), (FAILED, 'Failed')]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4,
+                          editable=False)
+    # names of all imported authors, joined in 'author' for display
+    author = models.CharField(max_length=100)
+    authors = models.JSONField(default=list)
+    refresh = models.BooleanField(default=False)
+    state = models.CharField(max_length=10, choices=STATES, default=PENDING)
+    pages_fetched = models.IntegerField(default=0)
+    books_written = models.IntegerField(default=0)
+    # counts of every author and startIndex of the author's first page not
+    # saved yet, where a failed job resumes
+    progress = models.JSONField(default=dict)
+    counts = models.JSONField(null=True)
+    error = models.TextField(null=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.author} ({self.state})"
@@ -0,0 +1,45 @@
+"""
+This module provides pagination classes for Bookstore views.
+"""
+
+from rest_framework.pagination import CursorPagination
+
+
+class BookCursorPagination(CursorPagination):
+    """
+    A class for keyset pagination of Book lists ordered by id.
+
+    The opaque cursor encodes the last returned id, so every page is
+    fetched with an indexed 'id > last_id' lookup instead of an OFFSET scan.
+    """
+    ordering = 'id'
+    cursor_query_param = 'cursor'
+    page_size = 100
+    page_size_query_param = 'limit'
+    max_page_size = 1000
+    # Query parameters used by pagination itself, not by book filtering
+    query_params = ('cursor', 'limit', 'paginate')
+
+    @classmethod
+    def is_disabled(cls, query_params):
+        """Return True if the legacy unpaginated list was requested."""
+        return query_params.get('paginate', '').lower() == 'false'
+
+    @classmethod
+    def for_books(cls, queryset):
+        """Return a paginator for a queryset of books, in relevance order
+        for title searches annotated with 'rank'."""
+        if 'rank' in queryset.query.annotations:
+            return SearchCursorPagination()
+        return cls()
+
+
+class SearchCursorPagination(BookCursorPagination):
+    """
+    A class for keyset pagination of title searches ordered by relevance
+    'rank' (best matches first) and by id among equally ranked books.
+
+    The cursor encodes the last returned rank and how many books with that
+    rank were already returned.
+    """
+    ordering = ('-rank', 'id')
@@ -0,0 +1,122 @@
+"""
+This module provides renderers for Bookstore views.
+"""
+
+import csv
+import io
+import json
+import msgpack
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+from .export import AUTHORS_SEPARATOR
+
+
+class RawJSON(str):
+    """
+    A class for JSON documents assembled ahead of rendering, e.g. from
+    stored book fragments.
+    """
+
+
+def load_raw(data):
+    """
+    This function parses RawJSON documents for renderers of other formats
+    and returns other data unchanged.
+    """
+    if isinstance(data, RawJSON):
+        return orjson.loads(str(data))
+    return data
+
+
+def default(obj):
+    """
+    This function encodes types unknown to orjson and msgpack like DRF's
+    JSONEncoder, e.g. Decimal or lazy translations.
+    """
+    return JSONEncoder().default(obj)
+
+
+class BookJSONRenderer(JSONRenderer):
+    """
+    A class for JSON renderer passing RawJSON documents through without
+    encoding them again and encoding other data with orjson. Indented
+    responses are encoded by DRF's JSONRenderer.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, RawJSON):
+            return data.encode()
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type or '',
+                           renderer_context or {}):
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        return orjson.dumps(data, default=default,
+                            option=orjson.OPT_NON_STR_KEYS)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    A class for MessagePack renderer, a compact binary encoding of the
+    same documents as JSON responses.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(load_raw(data), default=default)
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    A class for newline delimited JSON renderer, writing a list as one
+    document per line.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not isinstance(data, list):
+            data = [data]
+        return ''.join(json.dumps(item) + '\n' for item in data).encode()
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    A class for CSV renderer, writing a list of dictionaries as rows under
+    a header with their keys. Lists, e.g. authors, are joined with
+    AUTHORS_SEPARATOR. Of a page of results only the results are written,
+    the next page is linked in the Link header.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        data = load_raw(data)
+        if isinstance(data, dict) and 'results' in data:
+            response = (renderer_context or {}).get('response')
+            if response is not None and data.get('next'):
+                response['Link'] = f'<{data["next"]}>; rel="next"'
+            data = data['results']
+        if not data:
+            return b''
+        if not isinstance(data, list):
+            data = [data]
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, list(data[0]))
+        writer.writeheader()
+        for row in data:
+            writer.writerow({
+                key: AUTHORS_SEPARATOR.join(map(str, value))
+                if isinstance(value, list) else value
+                for key, value in row.items()})
+        return buffer.getvalue().encode()
@@ -0,0 +1,118 @@
+"""
+This module provides indexed full-text search of book titles: an SQLite
+FTS5 trigram table kept in sync by triggers, or a pg_trgm index on
+PostgreSQL. When no index is available, searches fall back to
+title__icontains.
+"""
+
+from django.db import DatabaseError, connections, transaction
+from django.db.models import F, FloatField
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'bookstore_book_fts'
+TRIGRAM_INDEX = 'bookstore_book_title_trgm'
+# trigram indexes can't match phrases shorter than a single trigram
+MIN_PHRASE_LENGTH = 3
+
+SQLITE_INDEX = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, content='bookstore_book', content_rowid='id',
+        tokenize='trigram')""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai
+        AFTER INSERT ON bookstore_book BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title) VALUES (new.id, new.title);
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad
+        AFTER DELETE ON bookstore_book BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title)
+        VALUES ('delete', old.id, old.title);
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+        AFTER UPDATE OF id, title ON bookstore_book BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title)
+        VALUES ('delete', old.id, old.title);
+        INSERT INTO {FTS_TABLE}(rowid, title) VALUES (new.id, new.title);
+        END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+POSTGRESQL_INDEX = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"""CREATE INDEX IF NOT EXISTS {TRIGRAM_INDEX} ON bookstore_book
+        USING gin (UPPER(title) gin_trgm_ops)""",
+]
+
+available = set()
+
+
+def install_search_index(using='default', **kwargs):
+    """
+    Create the title search index for the database if it is missing and
+    rebuild its contents. Schema changes on SQLite recreate the books
+    table and drop its triggers, so this runs after every migration.
+    """
+    connection = connections[using]
+    statements = {'sqlite': SQLITE_INDEX,
+                  'postgresql': POSTGRESQL_INDEX}.get(connection.vendor)
+    if not statements:
+        return
+    if 'bookstore_book' not in connection.introspection.table_names():
+        return
+    try:
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+    except DatabaseError:
+        # FTS5/pg_trgm not available, searches use title__icontains
+        available.discard(using)
+    else:
+        available.add(using)
+
+
+def search_available(using='default'):
+    """Return True if the title search index exists for the database."""
+    if using in available:
+        return True
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = %s",
+                           [FTS_TABLE])
+        elif connection.vendor == 'postgresql':
+            cursor.execute("SELECT 1 FROM pg_indexes WHERE indexname = %s",
+                           [TRIGRAM_INDEX])
+        else:
+            return False
+        if cursor.fetchone():
+            available.add(using)
+            return True
+    return False
+
+
+def search_titles(queryset, phrase):
+    """
+    Filter queryset for books with the phrase in the title, annotated with
+    the relevance 'rank' and ordered by it (best matches first).
+    """
+    using = queryset.db
+    if len(phrase) < MIN_PHRASE_LENGTH or not search_available(using):
+        return queryset.filter(title__icontains=phrase)
+
+    if connections[using].vendor == 'sqlite':
+        match = '"' + phrase.replace('"', '""') + '"'
+        matches = RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+            [match])
+        # the index looks up the rank of a single matching row by rowid
+        rank = RawSQL(
+            f"SELECT -rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+            f"AND rowid = bookstore_book.id", [match],
+            output_field=FloatField())
+        return queryset.filter(id__in=matches).annotate(rank=rank) \
+            .order_by('-rank', 'id')
+
+    # pylint: disable=import-outside-toplevel
+    from django.contrib.postgres.search import TrigramSimilarity
+    return queryset.filter(title__icontains=phrase) \
+        .annotate(rank=TrigramSimilarity('title', phrase)) \
+        .order_by(F('rank').desc(), 'id')
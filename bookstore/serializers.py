@@ -3,7 +3,18 @@ This module provides serializers for Bookstore models.
 """
 
 from rest_framework import serializers
-from .models import Author, Book
+from .models import Author, Book, ImportJob
+from .middleware import timer
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    """
+    A class for list serializer reporting its time to request metrics.
+    """
+    @property
+    def data(self):
+        with timer('serializer'):
+            return super().data
 
 
 class AuthorSerializer(serializers. ModelSerializer):
@@ -27,7 +38,40 @@ class BookSerializer(serializers.ModelSerializer):
         fields = ['id', 'external_id', 'title', 'authors', 'acquired',
                   'published_year', 'thumbnail']
         read_only_fields = ['id']
+        list_serializer_class = TimedListSerializer
+
+    def __init__(self, *args, fields=None, **kwargs):
+        """Limit the serialized fields to 'fields', if given."""
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @property
+    def data(self):
+        with timer('serializer'):
+            return super().data
 
     def get_authors(self, obj):
-        """A method for getting Author objects' names."""
-        return [str(author) for author in obj.authors.all()]
+        """A method for getting Author objects' names in the order they
+        were added.
+
+        Uses the prefetched authors cache when the queryset was built with
+        book_queries.prefetch_authors, so serializing a list costs a single
+        query for all authors."""
+        if 'authors' in getattr(obj, '_prefetched_objects_cache', {}):
+            return [str(author) for author in obj.authors.all()]
+        return list(Book.authors.through.objects.filter(book_id=obj.id)
+                    .order_by('id').values_list('author__name', flat=True))
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    """
+    A class for ImportJob serializer.
+    """
+    class Meta:
+        model = ImportJob
+        fields = ['id', 'author', 'authors', 'refresh', 'state',
+                  'pages_fetched', 'books_written', 'counts', 'progress',
+                  'error', 'created', 'updated']
+        read_only_fields = fields
@@ -0,0 +1,35 @@
+"""
+This module provides signal handlers keeping stored book fragments up to
+date with saved books and authors.
+"""
+
+from django.db.models.signals import m2m_changed, post_save
+from django.dispatch import receiver
+from .models import Author, Book
+from .book_queries import refresh_fragments
+
+
+@receiver(post_save, sender=Book)
+def book_saved(sender, instance, raw=False, **kwargs):
+    """Refresh the fragment of a saved book."""
+    if not raw:
+        refresh_fragments([instance.id])
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+def book_authors_changed(sender, instance, action, reverse, pk_set,
+                         **kwargs):
+    """Refresh fragments of books whose authors changed. Books of an author
+    cleared from the reverse side aren't known and are left as they are."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    ids = pk_set if reverse else [instance.id]
+    if ids:
+        refresh_fragments(ids)
+
+
+@receiver(post_save, sender=Author)
+def author_saved(sender, instance, created, raw=False, **kwargs):
+    """Refresh fragments of books of a renamed author."""
+    if not created and not raw:
+        refresh_fragments(instance.book_set.values_list('id', flat=True))
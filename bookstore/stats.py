@@ -0,0 +1,153 @@
+"""
+This module provides catalogue statistics kept in CatalogueCount counters.
+Every write of books subtracts the counts of affected books before it and
+adds them back after it, so reading statistics of the whole catalogue
+doesn't aggregate the books table.
+"""
+
+from django.db import connections, router
+from django.db.models import Count, F, Q, QuerySet
+from .models import Author, Book, CatalogueCount
+
+FACETS = {'years': CatalogueCount.YEAR, 'authors': CatalogueCount.AUTHOR}
+
+
+def count_books(books):
+    """
+    This function returns counts of books and acquired books of a queryset
+    of books or ids by (dimension, value), with one grouped query by year
+    and one by author.
+    """
+    if isinstance(books, QuerySet):
+        books = books.values('id').order_by()
+    elif not books:
+        return {}
+    counts = {}
+    total = [0, 0]
+    for row in Book.objects.filter(id__in=books).order_by() \
+            .values('published_year') \
+            .annotate(books=Count('id'),
+                      acquired=Count('id', filter=Q(acquired=True))):
+        counts[(CatalogueCount.YEAR, str(row['published_year']))] = \
+            (row['books'], row['acquired'])
+        total[0] += row['books']
+        total[1] += row['acquired']
+    if total[0]:
+        counts[(CatalogueCount.ALL, '')] = tuple(total)
+    for row in Book.authors.through.objects.filter(book_id__in=books) \
+            .order_by().values('author_id') \
+            .annotate(books=Count('id'),
+                      acquired=Count('id', filter=Q(book__acquired=True))):
+        counts[(CatalogueCount.AUTHOR, str(row['author_id']))] = \
+            (row['books'], row['acquired'])
+    return counts
+
+
+def update_counts(counts, sign=1):
+    """
+    This function adds (sign=1) or subtracts (sign=-1) counts returned by
+    count_books to the counters with a single upsert on SQLite and
+    PostgreSQL.
+    """
+    if not counts:
+        return
+    rows = [(dimension, value, sign * books, sign * acquired)
+            for (dimension, value), (books, acquired) in counts.items()]
+    connection = connections[router.db_for_write(CatalogueCount)]
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        for dimension, value, books, acquired in rows:
+            CatalogueCount.objects.get_or_create(dimension=dimension,
+                                                 value=value)
+            CatalogueCount.objects.filter(
+                dimension=dimension, value=value).update(
+                books=F('books') + books, acquired=F('acquired') + acquired)
+        return
+    table = connection.ops.quote_name(CatalogueCount._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {table} (dimension, value, books, acquired) "
+            f"VALUES (%s, %s, %s, %s) "
+            f"ON CONFLICT (dimension, value) DO UPDATE SET "
+            f"books = {table}.books + excluded.books, "
+            f"acquired = {table}.acquired + excluded.acquired", rows)
+
+
+def lock_books(books):
+    """
+    This function locks rows of books of a queryset or ids until the end of
+    the transaction and returns the ids of the locked books. Writes lock
+    their books before remove_books, so that concurrent writes of the same
+    books update the counters one after another.
+    """
+    if isinstance(books, QuerySet):
+        books = books.values('id').order_by()
+    return set(Book.objects.select_for_update().filter(id__in=books)
+               .order_by('id').values_list('id', flat=True))
+
+
+def add_books(books):
+    """This function adds books of a queryset or ids to the counters."""
+    update_counts(count_books(books))
+
+
+def remove_books(books):
+    """This function subtracts books of a queryset or ids from the
+    counters."""
+    update_counts(count_books(books), sign=-1)
+
+
+def rebuild_counts():
+    """
+    This function recounts the counters from the whole catalogue, e.g.
+    after books were changed outside of the API.
+    """
+    CatalogueCount.objects.all().delete()
+    add_books(Book.objects.all())
+
+
+def format_stats(counts, facets):
+    """
+    This function returns the statistics response for counts by
+    (dimension, value), with the requested facets.
+    """
+    books, acquired = counts.get((CatalogueCount.ALL, ''), (0, 0))
+    stats = {"books": books, "acquired": acquired,
+             "not_acquired": books - acquired}
+    if 'years' in facets:
+        years = sorted((int(value), count) for (dimension, value), count
+                       in counts.items()
+                       if dimension == CatalogueCount.YEAR and count[0])
+        stats['years'] = {str(year): {"books": books, "acquired": acquired}
+                          for year, (books, acquired) in years}
+    if 'authors' in facets:
+        authors = {(dimension, value): count for (dimension, value), count
+                   in counts.items()
+                   if dimension == CatalogueCount.AUTHOR and count[0]}
+        names = dict(Author.objects.filter(
+            id__in=[int(value) for _, value in authors])
+            .values_list('id', 'name'))
+        stats['authors'] = {
+            names[int(value)]: {"books": books, "acquired": acquired}
+            for (_, value), (books, acquired) in sorted(
+                authors.items(), key=lambda item: names[int(item[0][1])])}
+    return stats
+
+
+def catalogue_stats(facets=tuple(FACETS)):
+    """
+    This function returns statistics of the whole catalogue read from the
+    counters.
+    """
+    dimensions = [CatalogueCount.ALL] + [FACETS[facet] for facet in facets]
+    counts = {(row.dimension, row.value): (row.books, row.acquired)
+              for row in CatalogueCount.objects.filter(
+                  dimension__in=dimensions)}
+    return format_stats(counts, facets)
+
+
+def filtered_stats(books, facets=tuple(FACETS)):
+    """
+    This function returns statistics of a filtered queryset of books,
+    aggregated with grouped queries.
+    """
+    return format_stats(count_books(books), facets)
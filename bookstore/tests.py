@@ -1,9 +1,42 @@
+import asyncio
+import csv
+import io
 import json
+import msgpack
+import requests
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
 from unittest.mock import patch
-from rest_framework.test import APITestCase, APIClient
+from asgiref.sync import sync_to_async
+from rest_framework.test import APITestCase, APIClient, APIRequestFactory
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connections
+from django.test import AsyncRequestFactory, SimpleTestCase, \
+    TransactionTestCase, override_settings
 from django.urls import reverse
-from .models import Author, Book
+from django.utils import timezone
+from .models import Author, Book, ImportJob
 from .serializers import BookSerializer
+from .google_api_handler import aiter_author_pages, fetch_books, \
+    iter_author_pages, parse_google_books_into_db
+from .import_jobs import JobSuperseded, run_import_job, start_job, tasks
+from .async_views import AsyncBooks, AsyncBookDetails, AsyncImportBooks
+from . import views
+from .book_queries import filter_books
+from .search import search_available
+from .benchmarks import run_benchmarks, compare_results
+from .export import export_ndjson
+from .file_import import import_file
+from .db import PrimaryReplicaRouter, STICKY_COOKIE, read_from_replica
+from .stats import filtered_stats, lock_books
+from .cache import catalogue_generation
 
 with open('bookstore/sample_database.json', 'r', encoding='utf-8') as spl_db:
     sample_database = json.loads(spl_db.read())
@@ -12,12 +45,32 @@ with open('bookstore/sample_google_response.json', 'r', encoding='utf-8') as s:
     sample_google_response = json.loads(s.read())
 
 
+def google_page(start_index, fetch_size):
+    """This function returns a page of sample_google_response shaped like
+    Google Books API search results."""
+    return {"totalItems": len(sample_google_response),
+            "items": sample_google_response[start_index:
+                                            start_index + fetch_size]}
+
+
+def google_pages(start_indexes, fetch_size, refresh):
+    """This function imitates iter_author_pages for Nowak, yielding pages of
+    sample_google_response from the author's start index."""
+    for index in range(start_indexes["Nowak"], len(sample_google_response),
+                       fetch_size):
+        yield "Nowak", index, google_page(index, fetch_size)
+
+
+@patch("bookstore.import_jobs.executor.submit",
+       lambda worker, *args: run_import_job(*args))
 class TestEndpoints(APITestCase):
     """
-    A class for testing all endpoints.
+    A class for testing all endpoints. Import jobs submitted to the worker
+    pool run right away.
     """
     def setUp(self):
         """This function prepares an API Client and sample models for tests."""
+        cache.clear()
         self.client = APIClient()
         for book in sample_database:
             authors_list = book['authors']
@@ -28,8 +81,7 @@ class TestEndpoints(APITestCase):
                             thumbnail=book['thumbnail'])
             new_book.save()
             for author in authors_list:
-                author_obj = Author(name=author)
-                author_obj.save()
+                author_obj, _ = Author.objects.get_or_create(name=author)
                 new_book.authors.add(author_obj.id)
 
     def test_get_api_spec(self):
@@ -44,12 +96,280 @@ class TestEndpoints(APITestCase):
     def test_get_request_books(self):
         """This function tests GET /books endpoint."""
         url = reverse('books')
+        books = Book.objects.order_by('id')
+        expected_data = BookSerializer(books, many=True).data
+        response = self.client.get(url)
+        assert response.status_code == 200
+        assert isinstance(response.json(), dict)
+        assert response.json()['results'] == expected_data
+        assert response.json()['next'] is None
+
+    def test_get_request_books_unpaginated(self):
+        """This function tests GET /books endpoint in legacy
+        unpaginated mode."""
+        url = reverse('books')
         books = Book.objects.all()
         expected_data = BookSerializer(books, many=True).data
+        response = self.client.get(url, {'paginate': 'false'})
+        assert response.status_code == 200
+        assert isinstance(response.json(), list)
+        assert response.json() == expected_data
+
+    def test_get_request_books_cursor(self):
+        """This function tests walking GET /books endpoint page by page
+        with cursor pagination."""
+        url = reverse('books')
+        response = self.client.get(url, {'limit': 1})
+        ids = [book['id'] for book in response.json()['results']]
+        while response.json()['next']:
+            response = self.client.get(response.json()['next'])
+            assert response.status_code == 200
+            assert len(response.json()['results']) <= 1
+            ids += [book['id'] for book in response.json()['results']]
+        expected_ids = list(Book.objects.order_by('id')
+                            .values_list('id', flat=True))
+        assert ids == expected_ids
+
+    def test_export_books_ndjson(self):
+        """This function tests streaming GET /books/export endpoint as
+        NDJSON."""
+        books = Book.objects.order_by('id')
+        expected_data = BookSerializer(books, many=True).data
+        response = self.client.get(reverse('books-export'))
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'application/x-ndjson'
+        content = b''.join(response.streaming_content).decode()
+        assert [json.loads(line) for line in content.splitlines()] == \
+            expected_data
+        assert ''.join(export_ndjson(books, chunk_size=2)) == content
+
+    def test_export_books_csv(self):
+        """This function tests streaming GET /books/export endpoint as CSV
+        with GET /books filters."""
+        response = self.client.get('/books/export.csv', {'from': 2021})
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'text/csv'
+        content = b''.join(response.streaming_content).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        books = Book.objects.filter(published_year__gte=2021).order_by('id')
+        assert [row['title'] for row in rows] == \
+            [book.title for book in books]
+        assert rows[0]['authors'].split(';') == \
+            [author.name for author in books[0].authors.order_by('id')]
+        response = self.client.get(reverse('books-export'),
+                                   HTTP_ACCEPT='text/csv')
+        assert response['Content-Type'] == 'text/csv'
+
+    def test_get_request_books_query_count(self):
+        """This function tests that GET /books reads stored fragments of
+        all books with a single query regardless of the number of books,
+        after reading the catalogue generation."""
+        url = reverse('books')
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        assert response.status_code == 200
+        assert len(response.json()['results']) == len(sample_database)
+
+    def test_get_request_books_fields(self):
+        """This function tests GET /books and GET /books/<id> limited to
+        requested fields, without querying authors unless requested."""
+        url = reverse('books')
+        books = Book.objects.order_by('id')
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'fields': 'id,title,acquired'})
+        assert response.status_code == 200
+        assert response.json()['results'] == [
+            {"id": book.id, "title": book.title, "acquired": book.acquired}
+            for book in books]
+        response = self.client.get(url, {'fields': 'title,authors',
+                                         'paginate': 'false', 'from': 2000})
+        assert response.json() == [
+            {"title": book['title'], "authors": book['authors']}
+            for book in BookSerializer(filter_books(**{'from': 2000}),
+                                       many=True).data]
+
+        url = reverse('books-details', args=[books[0].id])
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'fields': 'title'})
+        assert response.json() == {"title": books[0].title}
+        assert self.client.get(url, {'fields': 'isbn'}).status_code == 400
+
+    def test_get_request_books_formats(self):
+        """This function tests GET /books and GET /books/<id> rendered as
+        MessagePack and CSV by suffix or Accept header, with an ETag for
+        every format."""
+        url = reverse('books')
+        response = self.client.get(url)
+        expected_data = response.json()
+        json_etag = response['ETag']
+        response = self.client.get(url, HTTP_ACCEPT='application/msgpack')
+        assert response['Content-Type'] == 'application/msgpack'
+        assert msgpack.unpackb(response.content) == expected_data
+        assert response['ETag'] != json_etag
+        response = self.client.get('/books.msgpack', {'limit': 1})
+        assert msgpack.unpackb(response.content)['results'] == \
+            expected_data['results'][:1]
+
+        response = self.client.get('/books.csv', {'limit': 2})
+        assert response['Content-Type'] == 'text/csv; charset=utf-8'
+        assert 'rel="next"' in response['Link']
+        rows = list(csv.DictReader(io.StringIO(response.content.decode())))
+        assert [row['title'] for row in rows] == \
+            [book['title'] for book in expected_data['results'][:2]]
+        assert rows[0]['authors'] == \
+            ';'.join(expected_data['results'][0]['authors'])
+
+        book = expected_data['results'][0]
+        response = self.client.get(f"/books/{book['id']}.msgpack")
+        assert msgpack.unpackb(response.content) == book
+        response = self.client.get(reverse('books-details', args=[book['id']]),
+                                   {'fields': 'id,title'},
+                                   HTTP_ACCEPT='text/csv')
+        assert response.content.decode().splitlines() == \
+            ['id,title', f"{book['id']},{book['title']}"]
+
+    def test_get_request_books_cached(self):
+        """This function tests that repeated GET /books requests are served
+        from the cache until a book changes."""
+        url = reverse('books')
+        params = {'from': 2000, 'paginate': 'false'}
+        self.client.get(url, params)
+        # only the catalogue generation is read
+        with self.assertNumQueries(1):
+            response = self.client.get(url, params)
+        assert response.status_code == 200
+        assert not response.json()[1]['acquired']
+
+        self.client.patch(f"/books/{response.json()[1]['id']}/",
+                          data={"acquired": True})
+        response = self.client.get(url, params)
+        assert response.json()[1]['acquired']
+
+        response = self.client.get(reverse('cache-stats'))
+        assert response.json()['hits'] == 1
+        assert response.json()['misses'] == 2
+
+    def test_get_request_books_title_search(self):
+        """This function tests searching GET /books by a phrase in the
+        title."""
+        url = reverse('books')
+        response = self.client.get(url, {'title': 'OPOWIA',
+                                         'paginate': 'false'})
+        assert len(response.json()) == 3
+        response = self.client.get(url, {'title': 'new edition',
+                                         'paginate': 'false'})
+        assert [book['title'] for book in response.json()] == \
+            ['Opowiastki - new edition']
+        response = self.client.get(url, {'title': 'ki',
+                                         'paginate': 'false'})
+        assert len(response.json()) == 2
+
+    def test_get_request_books_title_search_paginated(self):
+        """This function tests that paginated title searches are ordered by
+        relevance like the unpaginated list."""
+        for title in ["Wielki smok w dalekich górach", "Smok i rycerz",
+                      "Smok", "Smok"]:
+            Book.objects.create(title=title, published_year=2000)
+        url = reverse('books')
+        expected = [book['id'] for book in self.client.get(
+            url, {'title': 'smok', 'paginate': 'false'}).json()]
+        assert expected != sorted(expected)
+        ids = []
+        response = self.client.get(url, {'title': 'smok', 'limit': 1})
+        while True:
+            ids += [book['id'] for book in response.json()['results']]
+            if not response.json()['next']:
+                break
+            response = self.client.get(response.json()['next'])
+        assert ids == expected
+        response = self.client.get(url, {'title': 'smok', 'limit': 2,
+                                         'fields': 'id'})
+        assert [book['id'] for book in response.json()['results']] == \
+            expected[:2]
+
+    def test_title_search_index_sync(self):
+        """This function tests that the title search index follows
+        book writes."""
+        assert search_available()
+        query = {'title__icontains': 'Funny'}
+        book = Book.objects.create(title="Funny stories", published_year=2022)
+        assert list(filter_books(**query)) == [book]
+        Book.objects.filter(id=book.id).update(title="Sad stories")
+        assert not filter_books(**query).exists()
+        book.delete()
+        assert not filter_books(title__icontains='Sad').exists()
+
+    def test_get_request_books_multiple_authors(self):
+        """This function tests filtering GET /books by a list of authors
+        with a single query."""
+        url = reverse('books')
+        params = {'authors': 'Marek Nowak,Katarzyna Nowak',
+                  'paginate': 'false'}
+        with self.assertNumQueries(2):
+            response = self.client.get(url, params)
+        assert [book['title'] for book in response.json()] == ['Opowiastki']
+        params['authors_match'] = 'any'
+        response = self.client.get(url, params)
+        assert len(response.json()) == 3
+        params = {'authors': ['Marek Nowak'], 'authors_match': 'exact'}
+        books = filter_books(**params)
+        assert sorted(book.title for book in books) == \
+            ['Opowiadania', 'Opowiastki - new edition']
+
+    def test_get_request_books_etag(self):
+        """This function tests conditional GET /books requests."""
+        url = reverse('books')
         response = self.client.get(url)
+        etag = response['ETag']
+        assert etag.startswith('"')
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert response['ETag'] == etag
+        response = self.client.get(url, {'from': 2020},
+                                   HTTP_IF_NONE_MATCH=etag)
         assert response.status_code == 200
-        assert isinstance(response.data, list)
-        assert response.data == expected_data
+
+        book_id = Book.objects.first().id
+        self.client.patch(f"/books/{book_id}/", data={"acquired": True})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response['ETag'] != etag
+
+    def test_get_request_book_etag(self):
+        """This function tests conditional GET /books/<id> requests."""
+        url = f"/books/{Book.objects.first().id}/"
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        self.client.patch(url, data={"acquired": True})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response.json()['acquired']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='*')
+        assert response.status_code == 304
+        response = self.client.get('/books/99999/', HTTP_IF_NONE_MATCH='*')
+        assert response.status_code == 404
+
+    def test_book_fragments(self):
+        """This function tests that stored fragments follow changes of
+        books and authors."""
+        book = Book.objects.get(title="Opowiadania")
+        assert json.loads(book.fragment) == BookSerializer(book).data
+        self.client.patch(f"/books/{book.id}/", data={"acquired": True})
+        Author.objects.filter(name="Marek Nowak").update(name="Marek")
+        author = Author.objects.get(name="Marek")
+        author.name = "Marek N."
+        author.save()
+        book.refresh_from_db()
+        assert json.loads(book.fragment)['acquired']
+        assert json.loads(book.fragment)['authors'] == ["Marek N."]
+
+        Book.objects.filter(id=book.id).update(fragment=None)
+        response = self.client.get(reverse('books'), {'paginate': 'false'})
+        assert response.json() == BookSerializer(
+            Book.objects.all(), many=True).data
 
     def test_post_request_books_new(self):
         """This function tests POST /books endpoint when the specified
@@ -101,6 +421,95 @@ class TestEndpoints(APITestCase):
         assert response.status_code == 200
         assert response.data == expected_response
 
+    def test_post_request_books_batch(self):
+        """This function tests POST /books endpoint with a list of books."""
+        test_data = [
+            {"title": "Opowiadania 2", "authors": ["Martyna Nowak"],
+             "published_year": 2020},
+            {"title": "Opowiadania", "authors": ["Marek Nowak"],
+             "published_year": 2021},
+            {"title": "Opowiadania 2", "authors": ["Martyna Nowak"],
+             "published_year": 2020},
+            {"title": "Opowiadania 3"},
+        ]
+        url = reverse('books')
+        response = self.client.post(url, test_data, format='json')
+        assert response.status_code == 207
+        assert [result['status'] for result in response.data] == \
+            [201, 200, 200, 400]
+        assert response.data[0]['book']['authors'] == ["Martyna Nowak"]
+        assert Book.objects.filter(title="Opowiadania 2").count() == 1
+
+        response = self.client.post(url, [
+            1, {"title": "A", "authors": [{"x": 1}], "published_year": 1},
+            {"title": ["A"], "published_year": 1},
+            {"title": "Opowiadania 4", "published_year": 2020}],
+            format='json')
+        assert response.status_code == 207
+        assert [result['status'] for result in response.data] == \
+            [400, 400, 400, 201]
+
+    def test_patch_request_books_batch(self):
+        """This function tests PATCH /books endpoint for a list of ids and
+        for a filter."""
+        url = reverse('books')
+        ids = list(Book.objects.values_list('id', flat=True))
+        response = self.client.patch(
+            url, {"ids": ids[:2] + [999], "acquired": True}, format='json')
+        assert response.status_code == 200
+        assert response.data == {"updated": ids[:2], "missing": [999]}
+        assert Book.objects.filter(acquired=True).count() == 3
+
+        response = self.client.patch(
+            url, {"filter": {"from": 2021}, "acquired": False},
+            format='json')
+        assert response.data == {"updated": ids[1:]}
+        assert Book.objects.filter(acquired=True).count() == 1
+
+        response = self.client.patch(
+            url, {"filter": {"acquired": True}, "acquired": False},
+            format='json')
+        assert response.data == {"updated": [ids[0]]}
+        assert Book.objects.filter(acquired=True).count() == 0
+
+        response = self.client.patch(url, {"acquired": True}, format='json')
+        assert response.status_code == 400
+        response = self.client.patch(
+            url, {"ids": ["x"], "acquired": True}, format='json')
+        assert response.status_code == 400
+        response = self.client.delete(url, {"ids": [[1]]}, format='json')
+        assert response.status_code == 400
+        response = self.client.patch(url, [{"acquired": True}],
+                                     format='json')
+        assert response.status_code == 400
+        assert Book.objects.count() == 3
+
+    def test_delete_request_books_batch(self):
+        """This function tests DELETE /books endpoint for a list of ids and
+        for a filter."""
+        url = reverse('books')
+        ids = list(Book.objects.values_list('id', flat=True))
+        number_of_authors_before_del = Author.objects.count()
+        response = self.client.delete(url, {"ids": [ids[0], 999]},
+                                      format='json')
+        assert response.status_code == 200
+        assert response.data == {"deleted": [ids[0]], "missing": [999]}
+        response = self.client.delete(
+            url, {"filter": {"title": "new edition"}}, format='json')
+        assert response.data == {"deleted": [ids[2]]}
+        assert list(Book.objects.values_list('id', flat=True)) == [ids[1]]
+        assert Author.objects.count() == number_of_authors_before_del
+        response = self.client.delete(url, {"filter": {}}, format='json')
+        assert response.status_code == 400
+        for body in ({"filter": {"titel": "Book 1"}},
+                     {"filter": {"title": ""}},
+                     {"filter": {"paginate": "false"}},
+                     {"filter": {"author": 5}}, {"filter": {"from": "x"}},
+                     {"filter": {"authors": " , "}}, [ids[1]]):
+            response = self.client.delete(url, body, format='json')
+            assert response.status_code == 400
+        assert list(Book.objects.values_list('id', flat=True)) == [ids[1]]
+
     def test_get_request_book(self):
         """This function tests GET /books/<id> endpoint."""
         test_data = {"id": 2}
@@ -136,16 +545,748 @@ class TestEndpoints(APITestCase):
         assert number_of_books_before_del > number_of_books_after_del
         assert number_of_authors_before_del == number_of_authors_after_del
 
-    @patch("bookstore.views.fetch_books")
-    def test_post_import_books(self, mock_fetch_books):
+    @patch("bookstore.import_jobs.iter_author_pages")
+    def test_post_import_books(self, mock_iter_pages):
         """This function tests POST /import endpoint."""
         url = reverse('bookstore-import-books')
         data = json.dumps({
             "author": "Nowak"
         })
-        mock_fetch_books.return_value = sample_google_response
-        response = self.client.post(url, data, content_type='application/json')
+        mock_iter_pages.return_value = [("Nowak", 0, google_page(0, 40))]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, data,
+                                        content_type='application/json')
 
-        assert response.status_code == 200
+        assert response.status_code == 202
         assert isinstance(response.data, dict)
-        assert isinstance(response.data['imported'], int)
+        assert response.data['state'] == ImportJob.PENDING
+
+        url = reverse('bookstore-import-job',
+                      kwargs={'job_id': response.data['id']})
+        response = self.client.get(url)
+        assert response.status_code == 200
+        assert response.data['state'] == ImportJob.FINISHED
+        assert response.data['books_written'] == len(sample_google_response)
+        assert isinstance(response.data['counts']['imported'], int)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('bookstore-import-books'),
+                                        data, content_type='application/json')
+        job = ImportJob.objects.get(id=response.data['id'])
+        assert job.counts['unchanged'] == len(sample_google_response)
+        assert job.books_written == 0
+
+    @patch("bookstore.import_jobs.iter_author_pages")
+    def test_post_import_books_failed(self, mock_iter_pages):
+        """This function tests that a failing import is reported by
+        GET /import/<job_id> endpoint."""
+        url = reverse('bookstore-import-books')
+        mock_iter_pages.side_effect = ValueError("Google is down")
+        with self.assertRaises(ValueError):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(url, {"author": "Nowak"}, format='json')
+        job = ImportJob.objects.get()
+        assert job.state == ImportJob.FAILED
+        assert job.error == "Google is down"
+
+    @patch("bookstore.import_jobs.FETCH_SIZE", 2)
+    def test_resume_import_job(self):
+        """This function tests that POST /import/<job_id> resumes a failed
+        job after its last saved page."""
+        def failing_pages(start_indexes, fetch_size, refresh):
+            yield "Nowak", start_indexes["Nowak"], google_page(
+                start_indexes["Nowak"], fetch_size)
+            raise ValueError("Google is down")
+
+        with patch("bookstore.import_jobs.iter_author_pages",
+                   failing_pages), \
+                self.assertRaises(ValueError), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('bookstore-import-books'),
+                             {"author": "Nowak"}, format='json')
+        job = ImportJob.objects.get()
+        assert job.state == ImportJob.FAILED
+        assert job.progress["Nowak"]["next_start_index"] == 2
+        google_ids = [entry['id'] for entry in sample_google_response]
+        assert Book.objects.filter(external_id__in=google_ids).count() == 2
+
+        url = reverse('bookstore-import-job', kwargs={'job_id': job.id})
+        with patch("bookstore.import_jobs.iter_author_pages",
+                   google_pages), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url)
+        assert response.status_code == 202
+        job.refresh_from_db()
+        assert job.state == ImportJob.FINISHED
+        assert job.pages_fetched == 3
+        assert job.books_written == len(sample_google_response)
+        assert job.counts['imported'] == len(sample_google_response)
+        response = self.client.post(url)
+        assert response.status_code == 409
+
+    def test_resume_stalled_import_job(self):
+        """This function tests that POST /import/<job_id> resumes a running
+        job only once it stalled, e.g. because its worker died."""
+        job = ImportJob.objects.create(author="Nowak", authors=["Nowak"],
+                                       state=ImportJob.RUNNING)
+        url = reverse('bookstore-import-job', kwargs={'job_id': job.id})
+        response = self.client.post(url)
+        assert response.status_code == 409
+
+        ImportJob.objects.filter(id=job.id).update(
+            updated=timezone.now() - timedelta(hours=1))
+        with patch("bookstore.import_jobs.iter_author_pages",
+                   google_pages), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url)
+        assert response.status_code == 202
+        job.refresh_from_db()
+        assert job.state == ImportJob.FINISHED
+        assert job.counts['imported'] == len(sample_google_response)
+
+        job = ImportJob.objects.create(author="Nowak", authors=["Nowak"])
+        ImportJob.objects.filter(id=job.id).update(
+            updated=timezone.now() - timedelta(hours=1))
+        url = reverse('bookstore-import-job', kwargs={'job_id': job.id})
+        response = self.client.post(url)
+        assert response.status_code == 409
+
+    def test_import_job_claimed_once(self):
+        """This function tests that a job submitted twice runs once and that
+        a stalled run stops writing once the job is resumed."""
+        job = ImportJob.objects.create(author="Nowak", authors=["Nowak"])
+        with patch("bookstore.import_jobs.iter_author_pages", google_pages):
+            assert run_import_job(job.id, job.updated) is not None
+            assert run_import_job(job.id, job.updated) is None
+
+        job = ImportJob.objects.create(author="Nowak", authors=["Nowak"])
+        _, progress = start_job(job.id, job.updated)
+        ImportJob.objects.filter(id=job.id).update(
+            updated=timezone.now() - timedelta(hours=1))
+        url = reverse('bookstore-import-job', kwargs={'job_id': job.id})
+        with patch("bookstore.import_jobs.executor.submit") as submit, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url)
+        assert response.status_code == 202
+        assert submit.call_count == 1
+        with self.assertRaises(JobSuperseded):
+            progress.save_page("Nowak", 0, google_page(0, 40))
+        job.refresh_from_db()
+        assert job.state == ImportJob.PENDING
+        assert job.pages_fetched == 0
+
+    def test_post_import_books_authors(self):
+        """This function tests POST /import endpoint with a list of authors
+        sharing a volume, which is written once."""
+        def pages(start_indexes, fetch_size, refresh):
+            yield "Nowak", 0, {"totalItems": 3,
+                               "items": sample_google_response[0:3]}
+            yield "Kaczor", 0, {"totalItems": 3,
+                                "items": sample_google_response[2:5]}
+
+        url = reverse('bookstore-import-books')
+        with patch("bookstore.import_jobs.iter_author_pages", pages), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                url, {"authors": ["Nowak", "Kaczor", "Nowak"]},
+                format='json')
+        assert response.status_code == 202
+        assert response.data['authors'] == ["Nowak", "Kaczor"]
+        job = ImportJob.objects.get()
+        assert job.state == ImportJob.FINISHED
+        assert job.counts == {"imported": 5, "updated": 0, "unchanged": 0,
+                              "duplicates": 1}
+        assert job.progress["Kaczor"]["imported"] == 2
+        assert job.progress["Kaczor"]["duplicates"] == 1
+        assert job.progress["Nowak"]["finished"]
+        response = self.client.post(url, {"authors": []}, format='json')
+        assert response.status_code == 400
+
+    def test_book_stats(self):
+        """This function tests GET /books/stats endpoint, whose counters
+        follow POST, PATCH and DELETE requests."""
+        call_command('rebuild_stats', stdout=io.StringIO())
+        url = reverse('books-stats')
+        response = self.client.get(url)
+        assert response.status_code == 200
+        assert response.json() == filtered_stats(Book.objects.all())
+        assert response.json()['books'] == Book.objects.count()
+
+        self.client.post(reverse('books'), [
+            {"title": "New book", "authors": ["Marek Nowak", "Nowy Autor"],
+             "published_year": 2001, "acquired": True}], format='json')
+        book = Book.objects.order_by('id').first()
+        # rows are locked before their counts are subtracted
+        with patch("bookstore.views.lock_books", wraps=lock_books) as lock:
+            self.client.patch(reverse('books-details', args=[book.id]),
+                              {"acquired": not book.acquired},
+                              format='json')
+            self.client.patch(reverse('books'), {
+                "filter": {"from": "2000"}, "acquired": True},
+                format='json')
+            self.client.delete(reverse('books'), {"ids": [book.id]},
+                               format='json')
+        assert lock.call_count == 3
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        assert response.json() == filtered_stats(Book.objects.all())
+        assert response.json()['authors']['Nowy Autor'] == \
+            {"books": 1, "acquired": 1}
+
+        response = self.client.get(url, {'from': '2000',
+                                         'facets': 'years'})
+        assert response.json() == filtered_stats(
+            filter_books(**{'from': '2000'}), ['years'])
+        assert 'authors' not in response.json()
+        assert all(int(year) >= 2000 for year in response.json()['years'])
+        response = self.client.get(url, {'title': 'analiza'})
+        assert response.json()['books'] == len(
+            filter_books(title__icontains='analiza'))
+
+    def test_import_file_ndjson(self):
+        """This function tests POST /import/file endpoint with an NDJSON
+        body."""
+        records = [
+            # known external_id: updated
+            dict(sample_database[0], title="Opowiastki 2"),
+            # book without external_id already in the database: skipped
+            sample_database[1],
+            {"external_id": "new-1", "title": "Nowe opowiastki",
+             "authors": ["Marek Nowak"], "acquired": True,
+             "published_year": 2023, "thumbnail": None},
+            {"title": "Bez autora", "published_year": 2000},
+            # fields which don't fit the model: skipped
+            {"external_id": "x" * 201, "title": "Za długi identyfikator",
+             "published_year": 2000},
+            {"title": "Zła okładka", "published_year": 2000,
+             "thumbnail": "not a url"},
+            {"title": "Długa okładka", "published_year": 2000,
+             "thumbnail": "http://example.com/" + "x" * 200},
+        ]
+        body = "\n".join(json.dumps(record) for record in records) + \
+            "\nnot json\n"
+        response = self.client.post(reverse('bookstore-import-file'), body,
+                                    content_type='application/x-ndjson')
+        assert response.status_code == 200
+        assert response.data == {"inserted": 2, "updated": 1, "skipped": 5}
+        book = Book.objects.get(external_id="new-1")
+        assert book.acquired
+        assert [author.name for author in book.authors.all()] == \
+            ["Marek Nowak"]
+        assert Book.objects.get(
+            external_id=sample_database[0]['external_id']).title == \
+            "Opowiastki 2"
+
+        # importing the same file again writes nothing and keeps cached
+        # lists and ETags
+        generation = catalogue_generation()
+        response = self.client.post(reverse('bookstore-import-file'), body,
+                                    content_type='application/x-ndjson')
+        assert response.data == {"inserted": 0, "updated": 0, "skipped": 8}
+        assert catalogue_generation() == generation
+
+    def test_import_file_csv(self):
+        """This function tests POST /import/file endpoint with an uploaded
+        CSV file in several batches."""
+        content = "external_id,title,authors,acquired,published_year\n" \
+                  "csv-1,Pierwsza,Anna Nowak;Jan Nowak,true,2001\n" \
+                  ",Druga,Anna Nowak,false,2002\n" \
+                  ",Druga,Anna Nowak,false,2002\n"
+        upload = SimpleUploadedFile('books.csv', content.encode(),
+                                    content_type='text/csv')
+        with patch("bookstore.views.import_file",
+                   lambda lines, file_format: import_file(
+                       lines, file_format, batch_size=1)):
+            response = self.client.post(reverse('bookstore-import-file'),
+                                        {'file': upload})
+        assert response.status_code == 200
+        assert response.data == {"inserted": 2, "updated": 0, "skipped": 1}
+        book = Book.objects.get(external_id="csv-1")
+        assert book.acquired
+        assert {author.name for author in book.authors.all()} == \
+            {"Anna Nowak", "Jan Nowak"}
+        assert Book.objects.filter(title="Druga").count() == 1
+
+    def test_import_books_command(self):
+        """This function tests the import_books management command."""
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as file:
+            file.write(json.dumps({"title": "Z pliku",
+                                   "authors": ["Marek Nowak"],
+                                   "published_year": 2020}) + "\n")
+            file.flush()
+            out = io.StringIO()
+            call_command('import_books', file.name, stdout=out)
+        assert "inserted: 1" in out.getvalue()
+        assert Book.objects.filter(title="Z pliku").exists()
+
+    def test_get_import_job_invalid_id(self):
+        """This function tests GET /import/<job_id> endpoint for an
+        unknown job."""
+        job_id = '00000000-0000-0000-0000-000000000000'
+        url = reverse('bookstore-import-job', kwargs={'job_id': job_id})
+        response = self.client.get(url)
+        assert response.status_code == 404
+
+class GoogleBooksStub(BaseHTTPRequestHandler):
+    """
+    A request handler serving sample_google_response as Google Books API
+    search result pages.
+    """
+    volumes = sample_google_response
+    etag = None
+    delay = 0
+    requests = []
+
+    def do_GET(self):
+        """This function serves a page of volumes for given startIndex."""
+        GoogleBooksStub.requests.append(self.headers.get('If-None-Match'))
+        time.sleep(self.delay)
+        if self.etag and self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        query = parse_qs(urlparse(self.path).query)
+        start = int(query['startIndex'][0])
+        size = int(query['maxResults'][0])
+        page = {"totalItems": len(self.volumes),
+                "items": self.volumes[start:start + size]}
+        body = json.dumps(page).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        if self.etag:
+            self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        """This function silences request logging."""
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'google_books': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'google_books',
+    },
+})
+class TestFetchBooks(SimpleTestCase):
+    """
+    A class for testing fetching volumes from a local Google Books stub.
+    """
+    def setUp(self):
+        """This function starts a local Google Books API stub server."""
+        caches['google_books'].clear()
+        GoogleBooksStub.requests = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), GoogleBooksStub)
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def tearDown(self):
+        """This function stops the stub server."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_fetch_books_pages(self):
+        """This function tests that all pages are fetched in order."""
+        data = fetch_books("Nowak", google_books_url=self.url,
+                           max_concurrency=3, fetch_size=2)
+        assert data == sample_google_response
+
+    def test_fetch_books_deduplicates(self):
+        """This function tests that volumes repeated across pages are
+        returned once."""
+        volumes = sample_google_response + sample_google_response[:2]
+        with patch.object(GoogleBooksStub, 'volumes', volumes):
+            data = fetch_books("Nowak", google_books_url=self.url,
+                               fetch_size=2)
+        assert data == sample_google_response
+
+    def test_fetch_books_cached(self):
+        """This function tests that fresh cached pages are not refetched
+        unless a refresh is requested."""
+        fetch_books("Nowak", google_books_url=self.url, fetch_size=2)
+        assert len(GoogleBooksStub.requests) == 3
+        data = fetch_books("Nowak", google_books_url=self.url, fetch_size=2)
+        assert len(GoogleBooksStub.requests) == 3
+        assert data == sample_google_response
+        fetch_books("Nowak", google_books_url=self.url, fetch_size=2,
+                    refresh=True)
+        assert len(GoogleBooksStub.requests) == 6
+
+    @patch("bookstore.google_api_handler.google_books_cache_ttl", 0)
+    @patch.object(GoogleBooksStub, 'etag', '"v1"')
+    def test_fetch_books_revalidated(self):
+        """This function tests that stale cached pages are revalidated
+        with their ETag, kept after 304 responses without one."""
+        fetch_books("Nowak", google_books_url=self.url, fetch_size=2)
+        fetch_books("Nowak", google_books_url=self.url, fetch_size=2)
+        data = fetch_books("Nowak", google_books_url=self.url, fetch_size=2)
+        assert GoogleBooksStub.requests == [None] * 3 + ['"v1"'] * 6
+        assert data == sample_google_response
+
+    def test_iter_author_pages(self):
+        """This function tests that pages of all authors are fetched
+        in parallel."""
+        pages = list(iter_author_pages({"Nowak": 0, "Kaczor": 2},
+                                       google_books_url=self.url,
+                                       max_concurrency=2, fetch_size=2))
+        assert sorted((author, index) for author, index, _ in pages) == \
+            [("Kaczor", 2), ("Kaczor", 4), ("Nowak", 0), ("Nowak", 2),
+             ("Nowak", 4)]
+
+    @patch("bookstore.google_api_handler.google_books_timeout", 0.1)
+    @patch.object(GoogleBooksStub, 'delay', 0.5)
+    def test_iter_author_pages_timeout(self):
+        """This function tests that a request to a hung server times out."""
+        with self.assertRaises(requests.Timeout):
+            list(iter_author_pages({"Nowak": 0}, google_books_url=self.url,
+                                   fetch_size=2))
+
+    async def test_aiter_author_pages(self):
+        """This function tests that the asynchronous client fetches all
+        pages of all authors and caches them."""
+        pages = [(author, index) async for author, index, _ in
+                 aiter_author_pages({"Nowak": 0, "Kaczor": 2},
+                                    google_books_url=self.url,
+                                    max_concurrency=3, fetch_size=2)]
+        assert sorted(pages) == [("Kaczor", 2), ("Kaczor", 4), ("Nowak", 0),
+                                 ("Nowak", 2), ("Nowak", 4)]
+        assert len(GoogleBooksStub.requests) == 5
+        async for _ in aiter_author_pages({"Nowak": 0},
+                                          google_books_url=self.url,
+                                          fetch_size=2):
+            pass
+        assert len(GoogleBooksStub.requests) == 5
+
+
+class TestGoogleImport(APITestCase):
+    """
+    A class for testing parsing Google Books API data into the database.
+    """
+    def test_parse_google_books_into_db(self):
+        """This function tests importing new volumes with their authors."""
+        counter = parse_google_books_into_db(sample_google_response)
+        assert counter == {"imported": len(sample_google_response),
+                           "updated": 0, "unchanged": 0}
+        assert Book.objects.count() == len(sample_google_response)
+        book = Book.objects.get(external_id='AEqSNgAACAAJ')
+        assert sorted(str(author) for author in book.authors.all()) == \
+            ['Maria Nowak', 'Wiesława Kaczor']
+        assert Book.objects.get(external_id='epvqXwAACAAJ')\
+            .published_year == 2010
+
+    def test_parse_google_books_into_db_reimport(self):
+        """This function tests that re-importing volumes updates existing
+        books instead of creating doubles."""
+        parse_google_books_into_db(sample_google_response)
+        parse_google_books_into_db(sample_google_response)
+        assert Book.objects.count() == len(sample_google_response)
+        assert Author.objects.count() == 5
+        assert Book.authors.through.objects.count() == 6
+
+    def test_parse_google_books_into_db_unchanged(self):
+        """This function tests that re-importing unchanged volumes writes
+        nothing and changed volumes are updated."""
+        parse_google_books_into_db(sample_google_response)
+        changed = json.loads(json.dumps(sample_google_response))
+        changed[0]['volumeInfo']['title'] = "Zmieniony tytuł"
+        # a single SELECT of fingerprints inside the batch's savepoint
+        with self.assertNumQueries(3):
+            counter = parse_google_books_into_db(sample_google_response)
+        assert counter == {"imported": 0, "updated": 0,
+                           "unchanged": len(sample_google_response)}
+        counter = parse_google_books_into_db(changed)
+        assert counter == {"imported": 0, "updated": 1,
+                           "unchanged": len(sample_google_response) - 1}
+        assert Book.objects.get(external_id=changed[0]['id']).title == \
+            "Zmieniony tytuł"
+
+    def test_parse_google_books_into_db_manual_book(self):
+        """This function tests that a manually inserted book is matched
+        and updated with the external id."""
+        author = Author.objects.create(name='Edward Nowak')
+        entry = next(entry for entry in sample_google_response
+                     if entry['id'] == 'lZ1ynQAACAAJ')
+        book = Book.objects.create(title=entry['volumeInfo']['title'],
+                                   published_year=2017)
+        book.authors.add(author)
+        parse_google_books_into_db([entry])
+        book.refresh_from_db()
+        assert book.external_id == 'lZ1ynQAACAAJ'
+        assert Book.objects.count() == 1
+
+    def test_parse_google_books_into_db_author_order(self):
+        """This function tests that authors of an imported volume keep
+        Google's order in GET /books, GET /books/<id> and the export."""
+        names = ["Zed Alpha", "Amy Beta", "Mo Gamma"]
+        Author.objects.create(name="Mo Gamma")
+        entry = json.loads(json.dumps(sample_google_response[0]))
+        entry['volumeInfo']['authors'] = names
+        parse_google_books_into_db([entry])
+        book = Book.objects.get()
+        assert json.loads(book.fragment)['authors'] == names
+        assert BookSerializer(book).data['authors'] == names
+        response = self.client.get(reverse('books'), {'fields': 'authors'})
+        assert response.json()['results'][0]['authors'] == names
+        response = self.client.get(f'/books/{book.id}/')
+        assert response.json()['authors'] == names
+        response = self.client.get(reverse('books-export'),
+                                   HTTP_ACCEPT='text/csv')
+        content = b''.join(response.streaming_content).decode()
+        assert "Zed Alpha;Amy Beta;Mo Gamma" in content
+
+    def test_parse_google_books_into_db_query_count(self):
+        """This function tests that the number of queries does not grow
+        with the number of imported volumes."""
+        with self.assertNumQueries(16):
+            parse_google_books_into_db(sample_google_response)
+
+
+class TestBenchmarks(APITestCase):
+    """
+    A class for testing the microbenchmark suite.
+    """
+    def test_run_benchmarks(self):
+        """This function tests running all benchmarks on a small synthetic
+        catalogue and comparing them with a baseline."""
+        results = run_benchmarks(books=50, authors=10, import_volumes=20,
+                                 repeat=1)
+        assert Book.objects.count() == 70
+        assert results['serialize_books']['queries'] == 0
+        assert results['get_books_prefetch_authors']['queries'] == 2
+        assert results['stitch_fragments']['queries'] == 1
+        baseline = {name: dict(metrics, queries=metrics['queries'] / 2)
+                    for name, metrics in results.items()}
+        regressed = {row[0] for row in compare_results(results, baseline)
+                     if row[5]}
+        assert 'serialize_books' not in regressed
+        assert 'get_books_prefetch_authors' in regressed
+
+
+@override_settings(MIDDLEWARE=[
+    'bookstore.middleware.RequestMetricsMiddleware',
+    'django.middleware.common.CommonMiddleware',
+])
+class TestRequestMetrics(APITestCase):
+    """
+    A class for testing the request metrics middleware.
+    """
+    def setUp(self):
+        """This function prepares a sample book."""
+        cache.clear()
+        author = Author.objects.create(name="Frank Joker")
+        book = Book.objects.create(title="Funny stories",
+                                   published_year=2022)
+        book.authors.add(author)
+
+    def test_server_timing_header(self):
+        """This function tests that responses carry a Server-Timing
+        header with the number of queries."""
+        response = self.client.get(reverse('books'))
+        timing = response['Server-Timing']
+        for metric in ('db;dur=', 'serializer;dur=', 'render;dur=',
+                       'total;dur='):
+            assert metric in timing
+        assert 'desc="2 queries"' in timing
+
+    @patch("bookstore.middleware.slow_request_ms", -1)
+    def test_slow_request_logged(self):
+        """This function tests that slow requests are logged with their
+        SQL statements."""
+        with self.assertLogs('bookstore.middleware', 'WARNING') as logs:
+            self.client.get(reverse('books'))
+        assert 'SELECT' in logs.output[0]
+
+    def test_request_stats(self):
+        """This function tests GET /request_stats endpoint."""
+        self.client.get(reverse('books'))
+        self.client.get(reverse('books'))
+        response = self.client.get(reverse('request-stats'))
+        assert response.status_code == 200
+        stats = response.data['GET /books/']
+        assert stats['requests'] >= 2
+        assert sum(stats['histogram'].values()) == stats['requests']
+        response = self.client.get(reverse('request-stats'),
+                                   REMOTE_ADDR='10.1.2.3')
+        assert response.status_code == 403
+
+
+class TestAsyncViews(APITestCase):
+    """
+    A class for testing asynchronous views.
+    """
+    def setUp(self):
+        """This function prepares a request factory and a sample book."""
+        cache.clear()
+        self.factory = AsyncRequestFactory()
+        author = Author.objects.create(name="Frank Joker")
+        self.book = Book.objects.create(title="Funny stories",
+                                        published_year=2022)
+        self.book.authors.add(author)
+
+    async def test_get_books(self):
+        """This function tests asynchronous GET /books with ETags."""
+        view = AsyncBooks.as_view()
+        response = await view(self.factory.get('/books/'))
+        assert response.status_code == 200
+        results = json.loads(response.content)['results']
+        assert results[0]['title'] == "Funny stories"
+        assert results[0]['authors'] == ["Frank Joker"]
+        headers = {'If-None-Match': response['ETag']}
+        response = await view(self.factory.get('/books/', **headers))
+        assert response.status_code == 304
+
+    async def test_get_book(self):
+        """This function tests asynchronous GET /books/<id>."""
+        view = AsyncBookDetails.as_view()
+        url = f'/books/{self.book.id}/'
+        response = await view(self.factory.get(url), id=self.book.id)
+        assert response.status_code == 200
+        assert json.loads(response.content)['title'] == "Funny stories"
+        response = await view(self.factory.get('/books/0/'), id=0)
+        assert response.status_code == 404
+
+    async def test_get_books_msgpack(self):
+        """This function tests that asynchronous GET /books in formats other
+        than JSON is rendered by the synchronous view."""
+        response = await AsyncBooks.as_view()(
+            self.factory.get('/books.msgpack'), format='msgpack')
+        await sync_to_async(response.render)()
+        assert response.status_code == 200
+        assert msgpack.unpackb(response.content)['results'][0]['title'] == \
+            "Funny stories"
+
+    async def test_get_books_negotiated(self):
+        """This function tests that asynchronous GET /books negotiates the
+        format from the Accept header like the synchronous view."""
+        headers = {'Accept': 'text/csv, */*;q=0.1'}
+        response = await AsyncBooks.as_view()(
+            self.factory.get('/books/', **headers))
+        await sync_to_async(response.render)()
+        expected = await sync_to_async(views.Books.as_view())(
+            self.factory.get('/books/', **headers))
+        await sync_to_async(expected.render)()
+        assert response['Content-Type'].startswith('text/csv')
+        assert response.content == expected.content
+        response = await AsyncBooks.as_view()(
+            self.factory.get('/books/', **{'Accept': '*/*'}))
+        assert response['Content-Type'] == 'application/json'
+
+    async def test_post_books(self):
+        """This function tests that asynchronous POST /books is handled by
+        the synchronous view."""
+        data = {"title": "Sad stories", "published_year": 2021,
+                "authors": ["Frank Joker"]}
+        response = await AsyncBooks.as_view()(self.factory.post(
+            '/books/', json.dumps(data), content_type='application/json'))
+        response.render()
+        assert response.status_code == 201
+        assert json.loads(response.content)['title'] == "Sad stories"
+
+    async def test_post_import_books(self):
+        """This function tests that asynchronous POST /import runs the
+        import as a task on the event loop."""
+        async def pages(start_indexes, fetch_size, refresh):
+            yield "Nowak", 0, google_page(0, fetch_size)
+
+        patcher = patch("bookstore.import_jobs.aiter_author_pages", pages)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        response = await AsyncImportBooks.as_view()(self.factory.post(
+            '/import/', json.dumps({"author": "Nowak"}),
+            content_type='application/json'))
+        assert response.status_code == 202
+        await asyncio.gather(*tasks)
+        job = await sync_to_async(ImportJob.objects.get)(
+            id=json.loads(response.content)['id'])
+        assert job.state == ImportJob.FINISHED
+        assert job.books_written == len(sample_google_response)
+
+
+@patch("bookstore.db.replica_available", lambda: True)
+class TestReplicaRouting(APITestCase):
+    """
+    A class for testing routing of reads to a read replica.
+    """
+    def setUp(self):
+        """This function prepares a router and a request factory."""
+        self.router = PrimaryReplicaRouter()
+        self.factory = APIRequestFactory()
+
+    def test_reads_routed_to_replica(self):
+        """This function tests that reads inside read_from_replica() go to
+        the replica and all other queries to the primary."""
+        with read_from_replica(self.factory.get('/books/')):
+            assert self.router.db_for_read(Book) == 'replica'
+            assert self.router.db_for_write(Book) == 'default'
+        assert self.router.db_for_read(Book) == 'default'
+
+    def test_reads_after_write_sticky(self):
+        """This function tests that a client which wrote reads from the
+        primary."""
+        response = self.client.post(reverse('books'), [], format='json')
+        assert STICKY_COOKIE in response.cookies
+        request = self.factory.get('/books/')
+        request.COOKIES[STICKY_COOKIE] = response.cookies[STICKY_COOKIE].value
+        with read_from_replica(request):
+            assert self.router.db_for_read(Book) == 'default'
+        response = self.client.get(reverse('books'))
+        assert STICKY_COOKIE not in response.cookies
+
+
+class TestReplicaDatabases(TransactionTestCase):
+    """
+    A class for testing reads from a read replica kept in a second sqlite
+    file, which holds other rows than the primary database.
+    """
+    client_class = APIClient
+
+    def setUp(self):
+        """This function configures and migrates a 'replica' database."""
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        connections.settings['replica'] = dict(
+            connections.settings['default'],
+            NAME=os.path.join(directory.name, 'replica.sqlite3'))
+        self.addCleanup(self.remove_replica)
+        call_command('migrate', database='replica', verbosity=0)
+        Book.objects.using('replica').bulk_create(
+            [Book(title="Only in replica", published_year=2001)])
+
+    @staticmethod
+    def remove_replica():
+        """This function closes and removes the 'replica' database."""
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+
+    def test_replica_reads(self):
+        """This function tests that GET /books reads from the replica,
+        writes go to the primary and the client which wrote reads from
+        the primary afterwards."""
+        url = reverse('books')
+        response = self.client.get(url)
+        assert [book['title'] for book in response.json()['results']] == \
+            ["Only in replica"]
+
+        response = self.client.post(url, {"title": "Written",
+                                          "published_year": 2022},
+                                    format='json')
+        assert response.status_code == 201
+        assert STICKY_COOKIE in response.cookies
+        assert Book.objects.using('default').filter(title="Written").exists()
+        assert not Book.objects.using('replica').filter(
+            title="Written").exists()
+
+        response = self.client.get(url)
+        assert [book['title'] for book in response.json()['results']] == \
+            ["Written"]
+        self.client.cookies.pop(STICKY_COOKIE)
+        response = self.client.get(url)
+        assert [book['title'] for book in response.json()['results']] == \
+            ["Only in replica"]
@@ -1,15 +1,35 @@
 from django.urls import path
 from rest_framework.urlpatterns import format_suffix_patterns
+from api_challenge.settings import async_views
 from . import views
 
+if async_views:
+    from .async_views import AsyncBooks, AsyncBookDetails, AsyncImportBooks
+    books_view = AsyncBooks.as_view()
+    book_details_view = AsyncBookDetails.as_view()
+    import_books_view = AsyncImportBooks.as_view()
+else:
+    books_view = views.Books.as_view()
+    book_details_view = views.BookDetails.as_view()
+    import_books_view = views.ImportBooks.as_view()
+
 urlpatterns = [
     path('', views.home, name='home'),
     path('api_spec/', views.APISpec.as_view(), name='api-spec'),
-    path('books/', views.Books.as_view(), name='books'),
-    path('books?<query>/', views.Books.as_view(), name='book-filtered'),
-    path('books/<int:id>/', views.BookDetails.as_view(), name='books-details'),
-    path('import/', views.ImportBooks.as_view(),
-         name='bookstore-import-books'),
+    path('cache_stats/', views.CacheStats.as_view(), name='cache-stats'),
+    path('request_stats/', views.RequestStats.as_view(),
+         name='request-stats'),
+    path('books/', books_view, name='books'),
+    path('books/export/', views.ExportBooks.as_view(), name='books-export'),
+    path('books/stats/', views.BookStats.as_view(), name='books-stats'),
+    path('books?<query>/', books_view, name='book-filtered'),
+    path('books/<int:id>/', book_details_view, name='books-details'),
+    path('import/', import_books_view, name='bookstore-import-books'),
+    path('import/file/', views.ImportFile.as_view(),
+         name='bookstore-import-file'),
+    path('import/<uuid:job_id>/', views.ImportJobDetails.as_view(),
+         name='bookstore-import-job'),
 ]
 
-urlpatterns = format_suffix_patterns(urlpatterns, allowed=['json', 'html'])
+urlpatterns = format_suffix_patterns(
+    urlpatterns, allowed=['json', 'html', 'csv', 'ndjson', 'msgpack'])
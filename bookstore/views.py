@@ -3,18 +3,39 @@ This module provides functions and classes for all Bookstore views.
 """
 
 import json
-from django.http import Http404
+from django.http import Http404, StreamingHttpResponse
+from django.db import transaction
 from django.shortcuts import HttpResponseRedirect
+from django.utils.http import parse_etags
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
+from rest_framework.parsers import MultiPartParser
 from rest_framework.renderers import JSONRenderer
 from rest_framework.views import APIView
 from rest_framework import generics
+from rest_framework import serializers
 from rest_framework import status
-from api_challenge.settings import app_version
-from .serializers import BookSerializer
-from .google_api_handler import fetch_books, parse_google_books_into_db
-from .book_queries import get_books, get_book_details
-from .exceptions import InvalidId
+from api_challenge.settings import app_version, INTERNAL_IPS
+from .serializers import BookSerializer, ImportJobSerializer
+from .pagination import BookCursorPagination
+from .renderers import BookJSONRenderer, RawJSON, NDJSONRenderer, \
+    CSVRenderer, MessagePackRenderer
+from .export import export_csv, export_ndjson
+from .file_import import import_file
+from .import_jobs import enqueue_import, resume_import
+from .models import Book, ImportJob
+from .cache import books_cache_key, get_cached_books, set_cached_books, \
+    bump_catalogue_generation, cache_stats, catalogue_generation, \
+    catalogue_etag
+from .book_queries import get_books, get_book_details, prefetch_authors, \
+    find_duplicate_books, get_batch_books, create_books, get_fragments, \
+    refresh_fragments, select_fields, parse_ids
+from .middleware import get_endpoint_stats
+from .db import read_from_replica
+from .stats import add_books, remove_books, lock_books, catalogue_stats, \
+    filtered_stats, FACETS
+from .exceptions import InvalidId, InvalidJobId, InvalidBatch, \
+    InvalidImportFile, JobNotResumable, InvalidImportAuthors, InvalidFields
 
 
 def home(request):
@@ -22,6 +43,156 @@ def home(request):
     return HttpResponseRedirect('/books')
 
 
+def etag_matches(request, etag, any_etag=True):
+    """A function checking the request's If-None-Match header. With
+    any_etag=False '*' doesn't match, e.g. before the resource is known to
+    exist."""
+    etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    return (any_etag and '*' in etags) or etag in etags
+
+
+def not_modified(etag):
+    """A function returning an empty 304 response."""
+    return Response(status=status.HTTP_304_NOT_MODIFIED,
+                    headers={'ETag': etag, 'Vary': 'Accept'})
+
+
+def response_format(request):
+    """
+    A function returning the format of the renderer selected for a DRF
+    request, so that every format of a response gets its own ETag.
+    """
+    renderer = getattr(request, 'accepted_renderer', None)
+    return renderer.format if renderer else 'json'
+
+
+def get_books_data(request):
+    """
+    A function returning the ETag and data of GET /books for a DRF request,
+    or the ETag and None if the client's copy is still valid. Responses are
+    cached until the catalogue changes. Books are read from the replica, if
+    there is one.
+    """
+    with read_from_replica(request):
+        generation = catalogue_generation()
+        key = books_cache_key(request, generation)
+        etag = catalogue_etag(generation, key, response_format(request))
+        if etag_matches(request, etag):
+            return etag, None
+        data = get_cached_books(key)
+        if data is None:
+            data = list_books(request)
+            set_cached_books(key, data)
+    return etag, data
+
+
+def book_fields(query_params):
+    """
+    A function returning the list of book fields requested with 'fields',
+    or None if all fields are requested.
+    """
+    if 'fields' not in query_params:
+        return None
+    fields = [field.strip() for field in query_params['fields'].split(',')
+              if field.strip()]
+    if not fields or not set(fields) <= set(BookSerializer.Meta.fields):
+        raise InvalidFields
+    return list(dict.fromkeys(fields))
+
+
+def list_books(request):
+    """A function for getting serialized books for GET /books, stitched
+    together from stored JSON fragments. Books limited to requested
+    'fields' are serialized from only their columns."""
+    query = request.query_params.dict()
+    for param in BookCursorPagination.query_params + ('fields', 'format'):
+        query.pop(param, None)
+    fields = book_fields(request.query_params)
+    if fields is not None:
+        books = select_fields(get_books(query, method=None), fields)
+        if BookCursorPagination.is_disabled(request.query_params):
+            return BookSerializer(books, many=True, fields=fields).data
+        paginator = BookCursorPagination.for_books(books)
+        page = paginator.paginate_queryset(books, request)
+        return {"next": paginator.get_next_link(),
+                "previous": paginator.get_previous_link(),
+                "results": BookSerializer(page, many=True,
+                                          fields=fields).data}
+    books = get_books(query, method=None)
+    paginator = BookCursorPagination.for_books(books)
+    # the search paginator's cursor holds the 'rank' of the last book
+    books = books.values('id', 'fragment', *books.query.annotations)
+    if BookCursorPagination.is_disabled(request.query_params):
+        return RawJSON('[' + ','.join(get_fragments(books)) + ']')
+    page = paginator.paginate_queryset(books, request)
+    results = '[' + ','.join(get_fragments(page)) + ']'
+    return RawJSON(
+        f'{{"next":{json.dumps(paginator.get_next_link())},'
+        f'"previous":{json.dumps(paginator.get_previous_link())},'
+        f'"results":{results}}}')
+
+
+def get_book_data(request, book_id):
+    """
+    A function returning the ETag and data of GET /books/<id>, or the ETag
+    and None if the client's copy is still valid. The book is read from the
+    replica, if there is one.
+    """
+    fields = book_fields(request.query_params)
+    with read_from_replica(request):
+        etag = catalogue_etag(catalogue_generation(), 'book', book_id,
+                              fields, response_format(request))
+        if etag_matches(request, etag, any_etag=False):
+            return etag, None
+        if fields is None:
+            book = get_book_details({'id': book_id}, with_authors=True)
+        else:
+            book = select_fields(Book.objects.filter(id=book_id),
+                                 fields).first()
+        if book is None:
+            raise InvalidId
+        # '*' matches any existing book
+        if etag_matches(request, etag):
+            return etag, None
+        return etag, BookSerializer(book, fields=fields).data
+
+
+def book_item_errors(item):
+    """
+    A function returning errors of a list item of POST /books which can't
+    be checked for duplicates, or None.
+    """
+    if not isinstance(item, dict):
+        return {"non_field_errors": ["Expected a book object."]}
+    if not isinstance(item.get('title', ''), str):
+        return {"title": ["Not a valid string."]}
+    authors = item.get('authors') or []
+    if isinstance(authors, str):
+        authors = [authors]
+    if not isinstance(authors, list) or \
+            not all(isinstance(name, str) for name in authors):
+        return {"authors": ["Expected a list of author names."]}
+    return None
+
+
+def import_authors(data):
+    """
+    A function returning the distinct author names of an import request,
+    given as an 'author' or a list of 'authors'.
+    """
+    authors = data.get('authors', data.get('author'))
+    if isinstance(authors, str):
+        authors = [authors]
+    if not isinstance(authors, list):
+        raise InvalidImportAuthors
+    authors = list(dict.fromkeys(
+        name.strip() for name in authors
+        if isinstance(name, str) and name.strip()))
+    if not authors:
+        raise InvalidImportAuthors
+    return authors
+
+
 class ImportBooks(APIView):
     """
     A class for POST /import view.
@@ -30,13 +201,72 @@ class ImportBooks(APIView):
 
     def post(self, request):
         """
-        A method for POST requests.
+        A method for POST requests importing an 'author' or a list of
+        'authors'. The import runs in the background, its progress and
+        counts of every author are available at GET /import/<job_id>. Set
+        'refresh' to bypass cached Google Books responses.
         """
         data = json.loads(request.body)
-        author = data['author']
-        google_books_data = fetch_books(author)
-        counter = parse_google_books_into_db(google_books_data)
-        return Response(counter)
+        job = enqueue_import(import_authors(data),
+                             refresh=bool(data.get('refresh')))
+        serializer = ImportJobSerializer(job)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+
+class ImportFile(APIView):
+    """
+    A class for POST /import/file view.
+    """
+    renderer_classes = [JSONRenderer]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, format=None):  # pylint: disable=redefined-builtin
+        """
+        A method for POST requests importing books shaped like
+        sample_database.json from an NDJSON or CSV file, uploaded as
+        'file' or sent as the request body. The file is read as a stream
+        and written in batches.
+        """
+        if request.content_type.startswith('multipart/form-data'):
+            upload = request.FILES.get('file')
+            if upload is None:
+                raise InvalidImportFile
+            lines, content_type = upload, f"{upload.content_type} " \
+                                         f"{upload.name.lower()}"
+        else:
+            lines, content_type = request.stream, request.content_type
+        if lines is None:
+            raise InvalidImportFile
+        file_format = 'csv' if 'csv' in content_type else 'ndjson'
+        return Response(import_file(lines, file_format))
+
+
+class ImportJobDetails(generics.RetrieveAPIView):
+    """
+    A class for GET and POST /import/<job_id> view.
+    """
+    serializer_class = ImportJobSerializer
+    renderer_classes = [JSONRenderer]
+
+    def retrieve(self, request, *args, **kwargs):
+        """A method for GET /import/<job_id>."""
+        job = ImportJob.objects.filter(id=kwargs['job_id']).first()
+        if job is None:
+            raise InvalidJobId
+        serializer = ImportJobSerializer(job)
+        return Response(serializer.data)
+
+    def post(self, request, *args, **kwargs):
+        """A method for POST /import/<job_id> resuming a failed job, or one
+        stalled by a dead worker, after its last saved page."""
+        job = ImportJob.objects.filter(id=kwargs['job_id']).first()
+        if job is None:
+            raise InvalidJobId
+        job = resume_import(job)
+        if job is None:
+            raise JobNotResumable
+        serializer = ImportJobSerializer(job)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
 
 class APISpec(APIView):
@@ -52,22 +282,62 @@ class APISpec(APIView):
         return Response(app_version)
 
 
+class CacheStats(APIView):
+    """
+    A class for GET /cache_stats view.
+    """
+    renderer_classes = [JSONRenderer]
+
+    def get(self, request):
+        """
+        A method for GET requests.
+        """
+        return Response(cache_stats())
+
+
+class RequestStats(APIView):
+    """
+    A class for GET /request_stats view, available from INTERNAL_IPS only.
+    """
+    renderer_classes = [JSONRenderer]
+
+    def get(self, request):
+        """
+        A method for GET requests.
+        """
+        if request.META.get('REMOTE_ADDR') not in INTERNAL_IPS:
+            raise PermissionDenied
+        return Response(get_endpoint_stats())
+
+
 class Books(generics.ListCreateAPIView):
     """
     A class for GET /books and POST /books view.
     """
     serializer_class = BookSerializer
-    renderer_classes = [JSONRenderer]
+    renderer_classes = [BookJSONRenderer, MessagePackRenderer, CSVRenderer]
+    pagination_class = BookCursorPagination
 
-    def get(self, request):
-        """A method for GET requests."""
-        books = get_books(request.query_params.dict(), method=None)
-        serializer = BookSerializer(books, many=True)
-        return Response(serializer.data)
+    def get(self, request, format=None):  # pylint: disable=redefined-builtin
+        """A method for GET requests.
+
+        Results are paginated by cursor unless 'paginate=false' is given.
+        'fields' limits books to a comma separated list of fields.
+        Responses are cached until the catalogue changes. Books are
+        rendered as JSON, as MessagePack for books.msgpack or
+        'Accept: application/msgpack' and as CSV for books.csv or
+        'Accept: text/csv'.
+        """
+        etag, data = get_books_data(request)
+        if data is None:
+            return not_modified(etag)
+        return Response(data, headers={'ETag': etag, 'Vary': 'Accept'})
 
     def post(self, request):
-        """A method for POST requests."""
+        """A method for POST requests. A list of books is created in bulk."""
         data = json.loads(request.body)
+        if isinstance(data, list):
+            return self.post_many(data)
         book = get_books(data, method='exact')
         # Check if book is in the database to avoid doubles
         if book:
@@ -82,34 +352,181 @@ class Books(generics.ListCreateAPIView):
             return Response(response)
         serializer = BookSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                book = serializer.save()
+                add_books([book.id])
+            bump_catalogue_generation()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def post_many(self, data):
+        """A method for POST requests with a list of books, returning
+        a result for every item."""
+        results = []
+        new_books = {}
+        errors = [book_item_errors(item) for item in data]
+        books = iter(find_duplicate_books(
+            [item for item, error in zip(data, errors) if error is None]))
+        for item, error in zip(data, errors):
+            if error is not None:
+                results.append({"status": status.HTTP_400_BAD_REQUEST,
+                                "errors": error})
+                continue
+            book = next(books)
+            authors = item.get('authors') or []
+            if isinstance(authors, str):
+                authors = [authors]
+            key = (item.get('title'), str(item.get('published_year')),
+                   frozenset(authors))
+            if book or key in new_books:
+                message = "Use PATCH request to update 'acquired' status" \
+                    if 'acquired' in item else \
+                    "This book is already in the database"
+                results.append({"status": status.HTTP_200_OK,
+                                "message": message})
+                continue
+            serializer = BookSerializer(data=item)
+            if not serializer.is_valid():
+                results.append({"status": status.HTTP_400_BAD_REQUEST,
+                                "errors": serializer.errors})
+                continue
+            new_books[key] = (Book(**serializer.validated_data), authors)
+            results.append({"status": status.HTTP_201_CREATED,
+                            "book": new_books[key][0]})
+
+        with transaction.atomic():
+            create_books(new_books.values())
+        if new_books:
+            bump_catalogue_generation()
+
+        created = {book.id: book for book in prefetch_authors(
+            Book.objects.filter(id__in=[book.id for book, _ in
+                                        new_books.values()]))}
+        for result in results:
+            if 'book' in result:
+                book = created[result['book'].id]
+                result['book'] = BookSerializer(book).data
+        return Response(results, status=status.HTTP_207_MULTI_STATUS)
+
+    def patch(self, request):
+        """A method for PATCH requests setting 'acquired' for a list of
+        'ids' or for books matching a 'filter' with a single UPDATE."""
+        books = get_batch_books(request.data)
+        if books is None:
+            raise InvalidBatch
+        acquired = serializers.BooleanField().run_validation(
+            request.data.get('acquired'))
+        with transaction.atomic():
+            ids = lock_books(books)
+            remove_books(ids)
+            Book.objects.filter(id__in=ids).update(acquired=acquired)
+            refresh_fragments(ids)
+            add_books(ids)
+        bump_catalogue_generation()
+        return Response(self.batch_results(request.data, ids, 'updated'))
+
+    def delete(self, request):
+        """A method for DELETE requests removing a list of 'ids' or books
+        matching a 'filter' with a single set-based delete."""
+        books = get_batch_books(request.data)
+        if books is None:
+            raise InvalidBatch
+        with transaction.atomic():
+            ids = lock_books(books)
+            remove_books(ids)
+            Book.objects.filter(id__in=ids).delete()
+        bump_catalogue_generation()
+        return Response(self.batch_results(request.data, ids, 'deleted'))
+
+    @staticmethod
+    def batch_results(data, ids, action):
+        """A method for reporting processed and missing ids of a batch
+        request."""
+        results = {action: sorted(ids)}
+        if 'ids' in data:
+            results['missing'] = sorted(set(parse_ids(data['ids'])) - ids)
+        return results
+
+
+class BookStats(APIView):
+    """
+    A class for GET /books/stats view.
+    """
+    renderer_classes = [JSONRenderer]
+
+    def get(self, request):
+        """
+        A method for GET requests. Counts of books and acquired books of the
+        whole catalogue, by year and by author, are read from counters.
+        With GET /books filters the counts are aggregated for matching
+        books. 'facets' selects 'years' and/or 'authors'.
+        """
+        query = request.query_params.dict()
+        facets = [facet for facet in
+                  query.pop('facets', ','.join(FACETS)).split(',')
+                  if facet in FACETS]
+        with read_from_replica(request):
+            if query:
+                return Response(filtered_stats(
+                    get_books(query, method=None), facets))
+            return Response(catalogue_stats(facets))
+
+
+class ExportBooks(APIView):
+    """
+    A class for GET /books/export view.
+    """
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+
+    def get(self, request, format=None):  # pylint: disable=redefined-builtin
+        """
+        A method for GET requests streaming books matching GET /books
+        filters as NDJSON, or as CSV for 'format=csv', books/export.csv or
+        'Accept: text/csv'.
+        """
+        query = request.query_params.dict()
+        query.pop('format', None)
+        books = get_books(query, method=None)
+        if not books.ordered:
+            books = books.order_by('id')
+        renderer = request.accepted_renderer
+        export = export_csv if renderer.format == 'csv' else export_ndjson
+        response = StreamingHttpResponse(
+            export(books), content_type=renderer.media_type)
+        response['Content-Disposition'] = \
+            f'attachment; filename="books.{renderer.format}"'
+        return response
+
 
 class BookDetails(generics.RetrieveUpdateDestroyAPIView):
     """
     A class for GET, PATCH and DELETE /books/<id> view.
     """
     serializer_class = BookSerializer
-    renderer_classes = [JSONRenderer]
+    renderer_classes = [BookJSONRenderer, MessagePackRenderer, CSVRenderer]
 
     def retrieve(self, request, *args, **kwargs):
-        """A method for GET /books/<id>."""
-        book = get_book_details(kwargs)
-        if book is None:
-            raise InvalidId
-        serializer = BookSerializer(book)
-        return Response(serializer.data)
+        """A method for GET /books/<id>, limited to a comma separated list
+        of 'fields', if given. Rendered like GET /books."""
+        etag, data = get_book_data(request, kwargs['id'])
+        if data is None:
+            return not_modified(etag)
+        return Response(data, headers={'ETag': etag, 'Vary': 'Accept'})
 
     def patch(self, request, *args, **kwargs):
         """A method for PATCH /books/<id>."""
-        book = get_book_details(kwargs)
+        book = get_book_details(kwargs, with_authors=True)
         if book is None:
             raise InvalidId
         updated_value = request.data
         book.acquired = updated_value.get('acquired')
-        book.save()
+        with transaction.atomic():
+            if not lock_books([book.id]):
+                raise InvalidId
+            remove_books([book.id])
+            book.save()
+            add_books([book.id])
+        bump_catalogue_generation()
         serializer = BookSerializer(book)
         return Response(serializer.data)
 
@@ -123,5 +540,10 @@ class BookDetails(generics.RetrieveUpdateDestroyAPIView):
 
     def perform_destroy(self, instance):
         """A method for performing destroy on instance."""
-        instance.authors.clear()
-        instance.delete()
+        with transaction.atomic():
+            if not lock_books([instance.id]):
+                raise InvalidId
+            remove_books([instance.id])
+            instance.authors.clear()
+            instance.delete()
+        bump_catalogue_generation()